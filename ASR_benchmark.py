@@ -0,0 +1,235 @@
+import os
+
+# benchmark must run on an air-gapped CPU box, never touch the HuggingFace hub
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+import argparse
+import itertools
+import json
+import resource
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import torch
+
+from ASR_model import ASRModel
+from corpus_pack import CorpusPack, read_wav
+from log import get_logger
+
+"""
+Offline micro-benchmark for ASRModel.openai_whisper_process, no RabbitMQ / gateway needed.
+
+usage:
+    python ASR_benchmark.py --model-dir ASR_model/openai-whisper-small \
+        --clip-seconds 2 5 30 --batch-sizes 1 4 --threads 1 4 --dtypes float32 bfloat16
+
+one JSON object per configuration is written to stdout (or --output, JSON lines).
+"""
+
+RATE = 16000
+DTYPES = {
+    "float32": torch.float32,
+    "bfloat16": torch.bfloat16,
+    "float16": torch.float16,
+}
+logger = get_logger()
+
+
+def load_source(args: argparse.Namespace) -> np.ndarray:
+    """Audio the clips are cut from: a corpus pack clip, a wav file, or synthetic audio"""
+    if args.corpus:
+        pack = CorpusPack(args.corpus)
+        if pack.manifest[args.corpus_index]["sample_rate"] != RATE:
+            raise ValueError(f"{args.corpus}: expected {RATE} Hz audio")
+        return pack.audio(args.corpus_index)
+    if args.audio:
+        audio, sample_rate = read_wav(args.audio)
+        if sample_rate != RATE:
+            raise ValueError(f"{args.audio}: expected {RATE} Hz, got {sample_rate} Hz")
+        return audio
+    return synthetic_audio(max(args.clip_seconds))
+
+
+def synthetic_audio(seconds: float, seed: int = 0) -> np.ndarray:
+    """Speech-like test signal: amplitude-modulated harmonics plus light noise"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * RATE)) / RATE
+    f0 = 120 + 30 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / RATE
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 3 * t))
+    audio = 0.3 * envelope * voiced + 0.01 * rng.standard_normal(len(t))
+    return audio.astype(np.float32)
+
+
+def fit_clip(source: np.ndarray, seconds: float) -> np.ndarray:
+    """Tile or cut the source so the clip is exactly `seconds` long"""
+    n = int(seconds * RATE)
+    if len(source) >= n:
+        return source[:n]
+    return np.tile(source, n // len(source) + 1)[:n]
+
+
+def reset_peak_rss():
+    # Linux only: writing 5 to clear_refs resets VmHWM, so each config gets its own peak
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is KB on Linux, bytes on macOS; process-lifetime peak
+    scale = 1024 ** 2 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def count_tokens(asr: ASRModel, predicts_ids: torch.Tensor) -> int:
+    """Generated tokens, excluding padding and special tokens"""
+    special = set(asr.processor.tokenizer.all_special_ids)
+    return sum(1 for token in predicts_ids.flatten().tolist() if token not in special)
+
+
+def run_once(asr: ASRModel, batch: List[np.ndarray], max_new_tokens: Optional[int]) -> Dict[str, Any]:
+    generate_kwargs = {} if max_new_tokens is None else {"max_new_tokens": max_new_tokens}
+
+    t0 = time.perf_counter()
+    encoder_feature = asr.extract_features(batch, RATE)
+    t1 = time.perf_counter()
+    encoder_outputs = asr.encode(encoder_feature)
+    t2 = time.perf_counter()
+    predicts_ids = asr.decode(encoder_outputs, **generate_kwargs)
+    t3 = time.perf_counter()
+    texts = asr.processor.batch_decode(predicts_ids, skip_special_tokens=True)
+
+    return {
+        "feature_s": t1 - t0,
+        "encoder_s": t2 - t1,
+        "decoder_s": t3 - t2,
+        "total_s": t3 - t0,
+        "tokens": count_tokens(asr, predicts_ids),
+        "text": texts[0] if texts else "",
+    }
+
+
+def run_e2e(asr: ASRModel, batch: List[np.ndarray]) -> float:
+    """Wall time of the production path, openai_whisper_process, clip by clip"""
+    t0 = time.perf_counter()
+    for audio in batch:
+        asr.openai_whisper_process(audio, RATE)
+    return time.perf_counter() - t0
+
+
+def measure(asr: ASRModel, batch: List[np.ndarray], repeats: int, warmup: int,
+            max_new_tokens: Optional[int]) -> List[Dict[str, Any]]:
+    for _ in range(warmup):
+        run_once(asr, batch, max_new_tokens)
+    return [run_once(asr, batch, max_new_tokens) for _ in range(repeats)]
+
+
+def median_stages(runs: List[Dict[str, Any]]) -> Dict[str, float]:
+    return {key: float(np.median([r[key] for r in runs])) for key in ("feature_s", "encoder_s", "decoder_s", "total_s")}
+
+
+def benchmark(asr: ASRModel, source: np.ndarray, clip_seconds: float, batch_size: int,
+              threads: int, dtype_name: str, repeats: int, warmup: int,
+              max_new_tokens: Optional[int], e2e: bool) -> Dict[str, Any]:
+    torch.set_num_threads(threads)
+    batch = [fit_clip(source, clip_seconds)] * batch_size
+    audio_seconds = clip_seconds * batch_size
+
+    # eager baseline: hide the compiled batch sizes for this measurement
+    compiled_batch_sizes, asr.compiled_batch_sizes = asr.compiled_batch_sizes, set()
+    reset_peak_rss()
+    try:
+        runs = measure(asr, batch, repeats, warmup, max_new_tokens)
+    finally:
+        asr.compiled_batch_sizes = compiled_batch_sizes
+    stage = median_stages(runs)
+    tokens = int(np.median([r["tokens"] for r in runs]))
+
+    result = {
+        "model": asr.model_name,
+        "device": str(asr.device),
+        "clip_seconds": clip_seconds,
+        "batch_size": batch_size,
+        "threads": threads,
+        "dtype": dtype_name,
+        "repeats": repeats,
+        **stage,
+        "rtf": stage["total_s"] / audio_seconds,
+        "tokens": tokens,
+        "tokens_per_s": tokens / stage["decoder_s"] if stage["decoder_s"] > 0 else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "sample_text": runs[-1]["text"],
+    }
+    if batch_size in asr.compiled_batch_sizes:
+        compiled_stage = median_stages(measure(asr, batch, repeats, warmup, max_new_tokens))
+        result.update({f"compiled_{key}": value for key, value in compiled_stage.items()})
+        result["compiled_rtf"] = compiled_stage["total_s"] / audio_seconds
+        result["compiled_speedup"] = stage["total_s"] / compiled_stage["total_s"]
+    if e2e:
+        e2e_s = float(np.median([run_e2e(asr, batch) for _ in range(repeats)]))
+        result["e2e_s"] = e2e_s
+        result["e2e_rtf"] = e2e_s / audio_seconds
+    return result
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline ASRModel micro-benchmark")
+    parser.add_argument("--model-dir", default="ASR_model/openai-whisper-small",
+                        help="local model directory (processor + weights), never downloaded")
+    parser.add_argument("--audio", default=None, help="16kHz 16-bit PCM wav; synthetic audio if omitted")
+    parser.add_argument("--corpus", default=None, help="corpus pack directory (see corpus_pack.py), overrides --audio")
+    parser.add_argument("--corpus-index", type=int, default=0)
+    parser.add_argument("--clip-seconds", type=float, nargs="+", default=[2.0, 5.0, 30.0])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--threads", type=int, nargs="+", default=[torch.get_num_threads()])
+    parser.add_argument("--dtypes", nargs="+", choices=sorted(DTYPES), default=["float32"])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--max-new-tokens", type=int, default=None)
+    parser.add_argument("--e2e", action="store_true", help="also time openai_whisper_process itself")
+    parser.add_argument("--compiled", action="store_true",
+                        help="also measure the torch.compile + static KV cache path for every batch size")
+    parser.add_argument("--output", default=None, help="JSON lines file, stdout if omitted")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    asr = ASRModel(os.path.abspath(args.model_dir), local_files_only=True)
+    source = load_source(args)
+
+    out = open(args.output, "a") if args.output else sys.stdout
+    try:
+        for dtype_name in args.dtypes:
+            asr.model.to(DTYPES[dtype_name])
+            if args.compiled:
+                # compiled graphs are specialised on dtype, rebuild them for every dtype
+                asr.enable_compiled(args.batch_sizes)
+            for clip_seconds, batch_size, threads in itertools.product(
+                    args.clip_seconds, args.batch_sizes, args.threads):
+                result = benchmark(asr, source, clip_seconds, batch_size, threads, dtype_name,
+                                   args.repeats, args.warmup, args.max_new_tokens, args.e2e)
+                logger.info(f"benchmark {json.dumps(result, ensure_ascii=False)}")
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
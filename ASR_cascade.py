@@ -0,0 +1,59 @@
+import os
+from typing import Any, Dict, List, Optional
+
+from ASR_model import ASRModel
+from log import get_logger
+
+"""
+Confidence-based model cascade: a fast model (whisper-tiny) transcribes every clip first, and only
+clips it is not confident about are re-run on the accurate model (whisper-small).
+
+A clip is escalated when the fast transcript's average token log-probability is below
+CASCADE_LOGPROB_THRESHOLD, or its compression ratio is above CASCADE_COMPRESSION_THRESHOLD
+(repetition loops). Defaults follow openai-whisper's own fallback thresholds.
+"""
+
+CASCADE_FAST_MODEL = os.environ.get("ASR_CASCADE_FAST_MODEL", "openai-whisper-tiny")
+CASCADE_LOGPROB_THRESHOLD = float(os.environ.get("ASR_CASCADE_LOGPROB", -1.0))
+CASCADE_COMPRESSION_THRESHOLD = float(os.environ.get("ASR_CASCADE_COMPRESSION", 2.4))
+logger = get_logger()
+
+
+def needs_escalation(quality: Dict[str, float], logprob_threshold: float, compression_threshold: float) -> bool:
+    return quality["avg_logprob"] < logprob_threshold or quality["compression_ratio"] > compression_threshold
+
+
+class ModelCascade:
+    def __init__(self, fast: ASRModel, accurate: ASRModel,
+                 logprob_threshold: float = CASCADE_LOGPROB_THRESHOLD,
+                 compression_threshold: float = CASCADE_COMPRESSION_THRESHOLD):
+        self.fast = fast
+        self.accurate = accurate
+        self.logprob_threshold = logprob_threshold
+        self.compression_threshold = compression_threshold
+        self.accepted = 0
+        self.escalated = 0
+
+    def escalation_rate(self) -> float:
+        total = self.accepted + self.escalated
+        return self.escalated / total if total else 0.0
+
+    def process(self, audio: List[float], sp_rate, timings: Optional[Dict[str, float]] = None,
+                session: Optional[Dict[str, Any]] = None, quality: Optional[Dict[str, float]] = None) -> str:
+        """Same interface as ASRModel.process; fast-model stages are reported with a "fast_" prefix"""
+        fast_timings: Dict[str, float] = {}
+        fast_quality: Dict[str, float] = {}
+        text = self.fast.process(audio, sp_rate, fast_timings, session, fast_quality)
+        if timings is not None:
+            timings.update({f"fast_{stage}": elapsed for stage, elapsed in fast_timings.items()})
+
+        if not needs_escalation(fast_quality, self.logprob_threshold, self.compression_threshold):
+            self.accepted += 1
+            if quality is not None:
+                quality.update(fast_quality)
+            return text
+
+        self.escalated += 1
+        logger.debug(f"Cascade escalated: avg_logprob={fast_quality['avg_logprob']:.3f}, "
+                     f"compression_ratio={fast_quality['compression_ratio']:.2f}")
+        return self.accurate.process(audio, sp_rate, timings, session, quality)
@@ -1,14 +1,28 @@
 from transformers import Wav2Vec2ForCTC, Wav2Vec2Processor, WhisperProcessor, WhisperForConditionalGeneration
+from transformers.modeling_outputs import BaseModelOutput
 import torch
 import os
 from typing import Optional, Any, Tuple, List, Dict
 import numpy as np
 import re
+import time
+import zlib
+import hashlib
+from contextlib import contextmanager
 from log import get_logger
+from tensor_arena import TensorArena
+import metrics
 
 openai_whisper_small = "ASR_model/openai_whisper_small"
 openai_whisper_tiny = "openai/whisper-tiny"
 model_general_path = r"./ASR_model/"
+# torch.compile mode for the optional compiled path, "default" / "reduce-overhead" / "max-autotune"
+compile_mode = os.environ.get("ASR_COMPILE_MODE", "default")
+# silence inserted between packed short clips, wide enough for Whisper to close a segment
+pack_gap_seconds = float(os.environ.get("ASR_PACK_GAP_S", 1.0))
+whisper_window_seconds = 30.0
+# packed clip RMS above which it is expected to come back with text, quieter clips may stay empty
+pack_speech_rms = float(os.environ.get("ASR_PACK_SPEECH_RMS", 0.01))
 logger = get_logger()
 
 def store_modelin_local(model: Optional[WhisperForConditionalGeneration | Wav2Vec2ForCTC], 
@@ -21,32 +35,46 @@ def store_modelin_local(model: Optional[WhisperForConditionalGeneration | Wav2Ve
     model.save_pretrained(speicfic_path)
     return True
 
+whisper_size_pattern = re.compile(r'whisper[-_]?(tiny|base|small|medium)|(tiny|base|small|medium)[-_]?whisper', re.I)
+
 def is_call_openai_whisper(text):
-    # 忽略大小写，匹配 whisper 和 small 两个词，顺序不限，允许连接符 _, - 或无连接
-    pattern = re.compile(r'whisper[-_]?small|small[-_]?whisper', re.I)
-    return bool(pattern.search(text))
+    # 忽略大小写，匹配 whisper 和 tiny/base/small/medium 两个词，顺序不限，允许连接符 _, - 或无连接
+    return bool(whisper_size_pattern.search(text))
+
+def whisper_size(text) -> str:
+    """"tiny" / "base" / "small" / "medium" from a model name, "small" if none is given"""
+    match = whisper_size_pattern.search(text)
+    return (match.group(1) or match.group(2)).lower() if match else "small"
+
+def compression_ratio(text: str) -> float:
+    """Same repetition check as openai-whisper: high ratio means looping / hallucinated output"""
+    raw = text.encode("utf-8")
+    return len(raw) / len(zlib.compress(raw)) if raw else 0.0
 
-def load_model_test(model_name: str) -> Tuple[Optional[Wav2Vec2ForCTC | WhisperForConditionalGeneration], 
+def load_model_test(model_name: str, local_files_only: bool = False) -> Tuple[Optional[Wav2Vec2ForCTC | WhisperForConditionalGeneration], 
     Optional[Wav2Vec2Processor | WhisperProcessor], torch.device]:
     global model_general_path
     specific_path = os.path.join(model_general_path, model_name)
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     
     if not os.path.exists(specific_path):
-        logger.info("Model path does not exist. Auto Download openai whisper small.")
-        huggingface_model, auto_model_name = "openai/whisper-small", "openai-whisper-small"
+        if local_files_only:
+            # offline callers (benchmark) must never fall through to a HuggingFace download
+            raise FileNotFoundError(f"Model path {specific_path} does not exist.")
+        size = whisper_size(model_name)
+        logger.info(f"Model path does not exist. Auto Download openai whisper {size}.")
+        huggingface_model, auto_model_name = f"openai/whisper-{size}", f"openai-whisper-{size}"
         processor = WhisperProcessor.from_pretrained(huggingface_model)
         model = WhisperForConditionalGeneration.from_pretrained(huggingface_model)
         store_modelin_local(model, processor, auto_model_name)
         logger.info(f"Model downloaded and stored locally at ASR_model/{auto_model_name}.")
-        print(f"Model downloaded and stored locally at ASR_model/{auto_model_name}.")
 
         model = model.to(device)
         return model, processor, device
     
     if is_call_openai_whisper(model_name):
-        processor = WhisperProcessor.from_pretrained(specific_path)
-        model = WhisperForConditionalGeneration.from_pretrained(specific_path)
+        processor = WhisperProcessor.from_pretrained(specific_path, local_files_only=local_files_only)
+        model = WhisperForConditionalGeneration.from_pretrained(specific_path, local_files_only=local_files_only)
     else:
         raise ValueError("Model not recognized.")
     
@@ -55,10 +83,77 @@ def load_model_test(model_name: str) -> Tuple[Optional[Wav2Vec2ForCTC | WhisperF
         
     return model, processor, device
 
+def pack_clips(audios: List[np.ndarray], sp_rate: float, gap_seconds: float,
+               out: Optional[np.ndarray] = None) -> Tuple[np.ndarray, List[Tuple[float, float]]]:
+    """Concatenate clips with silence gaps, returns the window and every clip's (start, end) in seconds.
+    `out` (float32, exactly the packed length) is written in place when given."""
+    gap = int(gap_seconds * sp_rate)
+    total = sum(len(audio) for audio in audios) + gap * max(0, len(audios) - 1)
+    window = np.empty(total, dtype=np.float32) if out is None else out
+    spans, cursor = [], 0
+    for i, audio in enumerate(audios):
+        if i:
+            window[cursor:cursor + gap] = 0.0
+            cursor += gap
+        window[cursor:cursor + len(audio)] = audio
+        spans.append((cursor / sp_rate, (cursor + len(audio)) / sp_rate))
+        cursor += len(audio)
+    return window, spans
+
+def packed_seconds(lengths: List[int], sp_rate: float, gap_seconds: float) -> float:
+    return sum(lengths) / sp_rate + gap_seconds * max(0, len(lengths) - 1)
+
+def segment_bounds(segment: Dict[str, Any]) -> Tuple[float, float]:
+    start, end = segment["timestamp"]
+    return start, start if end is None else end
+
+def segment_owner(segment: Dict[str, Any], spans: List[Tuple[float, float]], gap_seconds: float) -> int:
+    """Clip the segment's midpoint falls in (gap split half-half), nearest clip otherwise"""
+    start, end = segment_bounds(segment)
+    middle = (start + end) / 2
+    distances = [
+        0.0 if clip_start - gap_seconds / 2 <= middle <= clip_end + gap_seconds / 2
+        else min(abs(middle - clip_start), abs(middle - clip_end))
+        for clip_start, clip_end in spans
+    ]
+    return int(np.argmin(distances))
+
+def split_by_timestamps(segments: List[Dict[str, Any]], spans: List[Tuple[float, float]], gap_seconds: float) -> List[str]:
+    """Give each timestamped segment to its segment_owner clip"""
+    texts: List[List[str]] = [[] for _ in spans]
+    for segment in segments:
+        texts[segment_owner(segment, spans, gap_seconds)].append(segment["text"].strip())
+    return [" ".join(t for t in clip_texts if t) for clip_texts in texts]
+
+def packed_fallback_clips(segments: List[Dict[str, Any]], spans: List[Tuple[float, float]], texts: List[str],
+                          has_speech: List[bool], gap_seconds: float) -> List[int]:
+    """Clips whose split text cannot be trusted: all of them when no timestamps came back, otherwise
+    every clip with speech but no text, plus the clips owning a segment that reaches into its span"""
+    if not segments:
+        return list(range(len(spans)))
+    rerun = set()
+    for i, (clip_start, clip_end) in enumerate(spans):
+        if texts[i] or not has_speech[i]:
+            continue
+        rerun.add(i)
+        for segment in segments:
+            start, end = segment_bounds(segment)
+            if start < clip_end and end > clip_start:
+                rerun.add(segment_owner(segment, spans, gap_seconds))
+    return sorted(rerun)
+
 class ASRModel:
-    def __init__(self, model_name: str):
+    def __init__(self, model_name: str, local_files_only: bool = False):
         self.model_name = model_name
-        self.model, self.processor, self.device = load_model_test(self.model_name)
+        self.model, self.processor, self.device = load_model_test(self.model_name, local_files_only)
+        # compiled path, empty until enable_compiled() is called
+        self.compiled_batch_sizes = set()
+        self.eager_modules: Dict[str, torch.nn.Module] = {}
+        self.compiled_modules: Dict[str, torch.nn.Module] = {}
+        # reusable audio buffers and model-input feature tensors
+        self.arena = TensorArena(self.device)
+        # optional on-disk log-mel / encoder-state cache (feature_cache.FeatureCache), set by the server
+        self.feature_cache: Optional[Any] = None
         
     def get_model(self) -> Tuple[Any, Any]:
         return self.model, self.processor
@@ -85,23 +180,221 @@ class ASRModel:
         
         return status
 
-    def process(self, audio: List[float], sp_rate) -> str:
+    def enable_compiled(self, batch_sizes: List[int]) -> List[int]:
+        """Compile encoder and decoder step with torch.compile against a static (preallocated) KV cache.
+        
+        Whisper inputs have a fixed shape (num_mel_bins x 3000 mel, 1500 encoder frames), so one
+        warm-up generate per batch size compiles every graph ahead of the first request. Batch sizes
+        not listed here, or whose warm-up failed (e.g. no C++ compiler), keep running eager.
+        Returns the batch sizes that are compiled.
+        """
+        base = self.model.model
+        self.eager_modules = {"encoder": base.encoder, "decoder": base.decoder}
+        self.compiled_modules = {
+            name: torch.compile(module, mode=compile_mode, dynamic=False)
+            for name, module in self.eager_modules.items()
+        }
+        self.compiled_batch_sizes = set()
+        
+        frames = 2 * self.model.config.max_source_positions
+        for batch_size in sorted(set(batch_sizes)):
+            dummy = torch.zeros(batch_size, self.model.config.num_mel_bins, frames,
+                                device=self.device, dtype=self.model.dtype)
+            self.compiled_batch_sizes.add(batch_size)
+            start = time.perf_counter()
+            try:
+                with torch.no_grad(), self.inference_modules(batch_size):
+                    self.model.generate(dummy, cache_implementation="static")
+                logger.info(f"Compiled batch size {batch_size} in {time.perf_counter() - start:.1f}s")
+            except Exception as e:
+                self.compiled_batch_sizes.discard(batch_size)
+                logger.warning(f"Compile failed for batch size {batch_size}, staying eager: {e}")
+        return sorted(self.compiled_batch_sizes)
+
+    @contextmanager
+    def inference_modules(self, batch_size: int, use_compiled: bool = True):
+        """Swap in the compiled encoder/decoder for covered batch sizes, yields whether it did"""
+        if not use_compiled or batch_size not in self.compiled_batch_sizes:
+            yield False
+            return
+        base = self.model.model
+        base.encoder, base.decoder = self.compiled_modules["encoder"], self.compiled_modules["decoder"]
+        try:
+            yield True
+        finally:
+            base.encoder, base.decoder = self.eager_modules["encoder"], self.eager_modules["decoder"]
+
+    def process(self, audio: List[float], sp_rate, timings: Optional[Dict[str, float]] = None,
+                session: Optional[Dict[str, Any]] = None, quality: Optional[Dict[str, float]] = None) -> str:
         """For input audio data processing
 
         Args:
             audio (List[float]): in future maybe a dictionary.
+            timings (Dict[str, float]): optional, filled with per-stage durations in seconds.
+            session (Dict[str, Any]): optional real-time session state, see session_cache.py.
+                "language" / "prompt" are used for decoding, "language" is filled once detected.
+            quality (Dict[str, float]): optional, filled with "avg_logprob" and "compression_ratio".
         """
         if is_call_openai_whisper(self.model_name):
-            return self.openai_whisper_process(audio, sp_rate)
+            return self.openai_whisper_process(audio, sp_rate, timings, session, quality)
         raise KeyError("Input model name got wrong.")
 
-    def openai_whisper_process(self, audio: np.ndarray, sp_rate: float) -> str:
+    def extract_features(self, audio: np.ndarray | List[np.ndarray], sp_rate: float) -> torch.Tensor:
+        """Log-mel feature extraction, returned on the model device/dtype.
+        
+        The returned tensor is the arena's persistent input buffer for this shape, it is
+        overwritten by the next call; clone it to keep it.
+        """
+        encoder_feature = self.processor.feature_extractor(
+            audio, sampling_rate=sp_rate, return_tensors="np"
+        ).input_features
+        return self.arena.features(encoder_feature, self.model.dtype)
+
+    def encode(self, encoder_feature: torch.Tensor) -> Any:
+        with torch.no_grad(), self.inference_modules(encoder_feature.shape[0]):
+            return self.model.get_encoder()(encoder_feature)
+
+    def decode(self, encoder_outputs: Any, **generate_kwargs) -> torch.Tensor:
+        with torch.no_grad(), self.inference_modules(encoder_outputs[0].shape[0]) as compiled:
+            if compiled:
+                generate_kwargs.setdefault("cache_implementation", "static")
+            return self.model.generate(encoder_outputs=encoder_outputs, **generate_kwargs)
+
+    def cached_encoder_outputs(self, audio: np.ndarray, sp_rate: float) -> Any:
+        """Encoder outputs through self.feature_cache, both log-mel and encoder states are keyed by audio hash"""
+        cache = self.feature_cache
+        key = cache.audio_key(audio, sp_rate)
+        # encoder states depend on weights and dtype, the file name must not contain extra dots
+        model_tag = hashlib.blake2b(f"{self.model_name}|{self.model.dtype}".encode(), digest_size=6).hexdigest()
+        encoder_name = f"{key}.{model_tag}.encoder.npy"
+        hidden = cache.get(encoder_name)
+        if hidden is not None:
+            return BaseModelOutput(last_hidden_state=torch.from_numpy(np.array(hidden)).to(self.device, dtype=self.model.dtype))
+        
+        mel_name = f"{key}.{self.model.config.num_mel_bins}.mel.npy"
+        mel = cache.get(mel_name)
+        if mel is not None:
+            encoder_feature = self.arena.features(np.array(mel), self.model.dtype)
+        else:
+            encoder_feature = self.extract_features(audio, sp_rate)
+            # the arena buffer is overwritten by the next request, the background writer gets a copy
+            cache.put(mel_name, encoder_feature.detach().to("cpu", torch.float32, copy=True).numpy())
+        encoder_outputs = self.encode(encoder_feature)
+        # queued before decoding and flushed at exit, so a task redelivered after generate() raised still hits
+        cache.put(encoder_name, encoder_outputs.last_hidden_state.detach().to("cpu", torch.float32, copy=True).numpy())
+        return encoder_outputs
+
+    def openai_whisper_packed_process(self, audios: List[np.ndarray], sp_rate: float,
+                                      timings: Optional[Dict[str, float]] = None) -> List[str]:
+        """Transcribe several short clips in one 30s window.
+        
+        Clips are joined with pack_gap_seconds of silence, decoded once with timestamp tokens,
+        and the segments are split back to the clips by their timestamps. Clips the split leaves
+        without text (see packed_fallback_clips) are transcribed again one at a time. The caller
+        keeps the packed length within whisper_window_seconds (see packed_seconds).
+        """
+        t0 = time.perf_counter()
+        lengths = [len(audio) for audio in audios]
+        window_length = int(sum(lengths) + int(pack_gap_seconds * sp_rate) * max(0, len(audios) - 1))
+        window, spans = pack_clips(audios, sp_rate, pack_gap_seconds, out=self.arena.audio(window_length))
+        with torch.no_grad():
+            encoder_feature = self.extract_features(window, sp_rate)
+            t1 = time.perf_counter()
+            with self.inference_modules(1) as compiled:
+                generate_kwargs = {"cache_implementation": "static"} if compiled else {}
+                predicts_ids = self.model.generate(encoder_feature, return_timestamps=True, **generate_kwargs)
+        t2 = time.perf_counter()
+        
+        decoded = self.processor.tokenizer.decode(predicts_ids[0], output_offsets=True)
+        segments = decoded.get("offsets", [])
+        transcriptions = split_by_timestamps(segments, spans, pack_gap_seconds)
+        t3 = time.perf_counter()
+        
+        has_speech = [len(audio) > 0 and float(np.sqrt(np.mean(np.square(audio)))) > pack_speech_rms for audio in audios]
+        fallback = packed_fallback_clips(segments, spans, transcriptions, has_speech, pack_gap_seconds)
+        if fallback:
+            # no timestamps, or a segment straddling clips: re-run those clips alone
+            metrics.PACK_FALLBACK_CLIPS.labels("empty_clip" if segments else "no_timestamps").inc(len(fallback))
+            logger.debug(f"Packed split failed for clips {fallback} of {len(audios)}, re-running them alone")
+            for i in fallback:
+                transcriptions[i] = self.openai_whisper_process(audios[i], sp_rate)
+        if timings is not None:
+            timings["feature"] = t1 - t0
+            timings["generate"] = t2 - t1
+            timings["detokenize"] = t3 - t2
+            if fallback:
+                timings["pack_fallback"] = time.perf_counter() - t3
+        return transcriptions
+
+    def detected_language(self, predicts_ids: torch.Tensor) -> Optional[str]:
+        """Language code from the language token generate() emitted, e.g. "en" for <|en|>.
+        
+        The language token follows <|startoftranscript|>; with prompt_ids the sequence starts
+        with <|startofprev|> and the prompt, so the position is looked up rather than fixed.
+        """
+        lang_to_id = getattr(self.model.generation_config, "lang_to_id", None) or {}
+        id_to_lang = {token_id: token[2:-2] for token, token_id in lang_to_id.items()}
+        tokens = predicts_ids[0].tolist()
+        start_id = self.model.generation_config.decoder_start_token_id
+        if start_id in tokens:
+            start = tokens.index(start_id) + 1
+            candidates = tokens[start:start + 1]
+        else:
+            # sequence returned without <|startoftranscript|>, the language token leads the forced prefix
+            candidates = tokens[:4]
+        for token_id in candidates:
+            if token_id in id_to_lang:
+                return id_to_lang[token_id]
+        return None
+
+    def sequence_quality(self, generated: Any, text: str) -> Dict[str, float]:
+        """Average log-probability of the generated non-special tokens, and the text's compression ratio"""
+        transition_scores = self.model.compute_transition_scores(
+            generated.sequences, generated.scores, normalize_logits=True
+        )[0]
+        tokens = generated.sequences[0, -transition_scores.shape[-1]:]
+        special = torch.tensor(self.processor.tokenizer.all_special_ids, device=tokens.device)
+        mask = ~torch.isin(tokens, special)
+        avg_logprob = transition_scores[mask].float().mean().item() if mask.any() else 0.0
+        return {"avg_logprob": avg_logprob, "compression_ratio": compression_ratio(text)}
+
+    def openai_whisper_process(self, audio: np.ndarray, sp_rate: float,
+                               timings: Optional[Dict[str, float]] = None,
+                               session: Optional[Dict[str, Any]] = None,
+                               quality: Optional[Dict[str, float]] = None) -> str:
+        t0 = time.perf_counter()
+        generate_kwargs: Dict[str, Any] = {}
+        if session is not None and session.get("language"):
+            # locked language: skips detection and keeps chunks of one stream consistent
+            generate_kwargs["language"] = session["language"]
+        if session is not None and session.get("prompt"):
+            generate_kwargs["prompt_ids"] = self.processor.get_prompt_ids(
+                session["prompt"], return_tensors="pt"
+            ).to(self.device)
+        if quality is not None:
+            generate_kwargs.update(return_dict_in_generate=True, output_scores=True)
         with torch.no_grad():
-            encoder_feature = self.processor(audio, sampling_rate=sp_rate, return_tensors="pt").input_features
-            encoder_feature = encoder_feature.to(self.device)
-            predicts_ids = self.model.generate(encoder_feature)
+            if self.feature_cache is not None:
+                # cache hit skips feature extraction and the encoder, "feature" then covers both
+                model_inputs = {"encoder_outputs": self.cached_encoder_outputs(audio, sp_rate)}
+            else:
+                model_inputs = {"input_features": self.extract_features(audio, sp_rate)}
+            t1 = time.perf_counter()
+            # compiled graphs are traced without a prompt, a prompted prefill stays eager
+            with self.inference_modules(1, use_compiled="prompt_ids" not in generate_kwargs) as compiled:
+                if compiled:
+                    generate_kwargs["cache_implementation"] = "static"
+                generated = self.model.generate(**model_inputs, **generate_kwargs)
+        t2 = time.perf_counter()
         
+        predicts_ids = generated.sequences if quality is not None else generated
         transcriptions = self.processor.batch_decode(predicts_ids, skip_special_tokens=True)
+        if quality is not None:
+            quality.update(self.sequence_quality(generated, transcriptions[0] if transcriptions else ""))
+        if session is not None and not session.get("language"):
+            session["language"] = self.detected_language(predicts_ids)
+        if timings is not None:
+            timings["feature"] = t1 - t0
+            timings["generate"] = t2 - t1
+            timings["detokenize"] = time.perf_counter() - t2
         return transcriptions[0] if transcriptions else ""
-    
-    
\ No newline at end of file
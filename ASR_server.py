@@ -1,17 +1,55 @@
 import pika
 import json
 from typing import List, Optional, Dict, Any
-from ASR_model import ASRModel
+from ASR_model import ASRModel, packed_seconds, pack_gap_seconds, whisper_window_seconds
+from ASR_cascade import ModelCascade, CASCADE_FAST_MODEL
 import base64
+import os
 import numpy as np
 from log import get_logger
+import metrics
+from profiling import InferenceProfiler
+from session_cache import SessionCache
+from feature_cache import FeatureCache, FEATURE_CACHE_DIR
 
 logger = get_logger()
+# e.g. "1,2,4": compile the static-cache path for these batch sizes at startup, empty = eager only
+COMPILE_BATCH_SIZES = [int(b) for b in os.environ.get("ASR_COMPILE_BATCH_SIZES", "").split(",") if b.strip()]
+# short-clip packing: queue clips up to PACK_MAX_CLIP_S and decode several of them in one 30s window
+PACK_ENABLED = os.environ.get("ASR_PACK", "0") == "1"
+PACK_MAX_CLIP_S = float(os.environ.get("ASR_PACK_MAX_CLIP_S", 8.0))
+PACK_MAX_CLIPS = int(os.environ.get("ASR_PACK_MAX_CLIPS", 8))
+PACK_MAX_WAIT_S = float(os.environ.get("ASR_PACK_MAX_WAIT_S", 0.05))
+PACK_SAMPLE_RATE = 16000
+# drop tasks left in asr_queue at startup (development); off by default with the feature cache,
+# whose main use is answering the task a crashed worker left unacked
+PURGE_ON_START = os.environ.get("ASR_PURGE_QUEUE", "0" if FEATURE_CACHE_DIR else "1") == "1"
+# confidence cascade: whisper-tiny first, escalate low-confidence clips to whisper-small (see ASR_cascade.py)
+CASCADE_ENABLED = os.environ.get("ASR_CASCADE", "0") == "1"
 
 
 class ASRServer:
     def __init__(self):
         self.asr_model = ASRModel("openai-whisper-small")
+        self.profiler = InferenceProfiler()
+        self.sessions = SessionCache()
+        feature_cache = FeatureCache(FEATURE_CACHE_DIR) if FEATURE_CACHE_DIR else None
+        self.asr_model.feature_cache = feature_cache
+        self.cascade: Optional[ModelCascade] = None
+        if CASCADE_ENABLED:
+            self.cascade = ModelCascade(ASRModel(CASCADE_FAST_MODEL), self.asr_model)
+            self.cascade.fast.feature_cache = feature_cache
+            metrics.register_cascade_gauges(self.cascade)
+            logger.info(f"Cascade enabled: {CASCADE_FAST_MODEL} -> {self.asr_model.model_name}, "
+                        f"logprob < {self.cascade.logprob_threshold}, compression > {self.cascade.compression_threshold}")
+        # packed windows have no per-clip confidence, so they cannot be escalated: the cascade wins
+        self.pack_enabled = PACK_ENABLED and self.cascade is None
+        if PACK_ENABLED and not self.pack_enabled:
+            logger.warning("ASR_PACK is ignored while ASR_CASCADE is on, short clips go through the cascade")
+        metrics.register_memory_gauges(self.asr_model.arena)
+        if COMPILE_BATCH_SIZES:
+            compiled = self.asr_model.enable_compiled(COMPILE_BATCH_SIZES)
+            logger.info(f"Compiled static-cache path for batch sizes {compiled}")
         self.connection = pika.BlockingConnection(
             pika.ConnectionParameters(
                 host = 'localhost',
@@ -22,6 +60,9 @@ class ASRServer:
                 )
             )
         self.channel = self.connection.channel()
+        # (method, props, audio, timings) waiting to be packed into one window
+        self.pending_clips: List[Any] = []
+        self.pack_timer = None
         
         # Check and log model status
         status = self.asr_model.check_model_status()
@@ -38,25 +79,11 @@ class ASRServer:
         self.channel.queue_declare(queue="asr_queue", durable=True)
         
         # Purge old messages from queue (useful during development)
-        purged = self.channel.queue_purge(queue="asr_queue")
-        logger.info(f"Purged {purged} old messages from queue")
-        print(f"Purged {purged} old messages from queue")
+        if PURGE_ON_START:
+            purged = self.channel.queue_purge(queue="asr_queue")
+            logger.info(f"Purged {purged} old messages from queue")
         
-        def callback(ch, method, props, body):
-            task_info = json.loads(body)
-            audio_data: List[float] = task_info["audio"]
-            audio_data = np.frombuffer(
-                base64.b64decode(
-                    audio_data
-                    ),
-                dtype=np.float32
-                )
-            
-            sample_rate: float = task_info['sample_rate']
-            recognized_text = self.asr_model.process(audio_data, sample_rate)
-            result = {
-                "text": recognized_text
-            }
+        def publish_result(ch, props, result: Dict[str, Any]):
             ch.basic_publish(
                 exchange='',
                 routing_key = props.reply_to,
@@ -65,14 +92,128 @@ class ASRServer:
                 ), 
                 body = json.dumps(result)
             )
-            ch.basic_ack(delivery_tag = method.delivery_tag)
+        
+        def callback(ch, method, props, body):
+            timings: Dict[str, float] = {}
+            metrics.observe_queue_wait(props.headers, timings)
+            metrics.IN_FLIGHT.labels("worker").inc()
+            try:
+                with metrics.stage_timer("worker", "json_decode", timings):
+                    task_info = json.loads(body)
+                
+                # control message: {"action": "profile", "count": N, "mode": "torch" | "cprofile"}
+                if task_info.get("action") == "profile":
+                    try:
+                        result = self.profiler.arm(task_info.get("count", 1), task_info.get("mode", "torch"))
+                    except ValueError as e:
+                        result = {"status": "error", "error": str(e)}
+                    publish_result(ch, props, result)
+                    ch.basic_ack(delivery_tag = method.delivery_tag)
+                    return
+                if task_info.get("profile") and self.profiler.remaining <= 0:
+                    try:
+                        self.profiler.arm(1, task_info.get("profile_mode", "torch"))
+                    except ValueError as e:
+                        logger.warning(f"Profiling request ignored: {e}")
+                
+                with metrics.stage_timer("worker", "base64_decode", timings):
+                    audio_data: List[float] = task_info["audio"]
+                    audio_data = np.frombuffer(
+                        base64.b64decode(
+                            audio_data
+                            ),
+                        dtype=np.float32
+                        )
+                
+                sample_rate: float = task_info['sample_rate']
+                # session chunks carry their own language / prompt, they are never packed with others
+                session = self.sessions.get(task_info.get("session_id"))
+                if (self.pack_enabled and session is None and self.profiler.remaining <= 0 and sample_rate == PACK_SAMPLE_RATE
+                        and len(audio_data) <= PACK_MAX_CLIP_S * sample_rate):
+                    enqueue_clip(ch, method, props, audio_data, timings)
+                    return
+                model_timings: Dict[str, float] = {}
+                if self.cascade is not None:
+                    process, models = self.cascade.process, [self.cascade.fast.model, self.cascade.accurate.model]
+                else:
+                    process, models = self.asr_model.process, [self.asr_model.model]
+                if self.profiler.remaining > 0:
+                    recognized_text = self.profiler.run(
+                        models, process, audio_data, sample_rate, model_timings, session,
+                        tag=props.correlation_id,
+                    )
+                else:
+                    recognized_text = process(audio_data, sample_rate, model_timings, session)
+                if session is not None:
+                    self.sessions.append_text(session, recognized_text)
+                metrics.observe_timings("worker", model_timings)
+                metrics.BATCH_SIZE.observe(1)
+                timings.update(model_timings)
+                result = {
+                    "text": recognized_text
+                }
+                with metrics.stage_timer("worker", "reply", timings):
+                    publish_result(ch, props, result)
+                    ch.basic_ack(delivery_tag = method.delivery_tag)
+                metrics.REQUESTS.labels("worker", "ok").inc()
+            except Exception:
+                metrics.REQUESTS.labels("worker", "error").inc()
+                raise
+            finally:
+                metrics.IN_FLIGHT.labels("worker").dec()
+                if not timings.get("packed"):
+                    metrics.log_request_timings("worker", props.correlation_id, timings)
+        
+        def enqueue_clip(ch, method, props, audio_data, timings):
+            timings["packed"] = 1
+            lengths = [len(clip[2]) for clip in self.pending_clips] + [len(audio_data)]
+            if packed_seconds(lengths, PACK_SAMPLE_RATE, pack_gap_seconds) > whisper_window_seconds:
+                flush_pending()
+            self.pending_clips.append((method, props, audio_data, timings))
+            if len(self.pending_clips) >= PACK_MAX_CLIPS:
+                flush_pending()
+            elif self.pack_timer is None:
+                # flush on the connection's own timer, so a lone clip waits at most PACK_MAX_WAIT_S
+                self.pack_timer = self.connection.call_later(PACK_MAX_WAIT_S, flush_pending)
+        
+        def flush_pending():
+            if self.pack_timer is not None:
+                self.connection.remove_timeout(self.pack_timer)
+                self.pack_timer = None
+            clips, self.pending_clips = self.pending_clips, []
+            if not clips:
+                return
+            
+            metrics.IN_FLIGHT.labels("worker").inc(len(clips))
+            try:
+                model_timings: Dict[str, float] = {}
+                texts = self.asr_model.openai_whisper_packed_process(
+                    [clip[2] for clip in clips], PACK_SAMPLE_RATE, model_timings
+                )
+                metrics.observe_timings("worker", model_timings)
+                metrics.BATCH_SIZE.observe(len(clips))
+                for (method, props, _, timings), text in zip(clips, texts):
+                    timings.update(model_timings)
+                    timings["pack_size"] = len(clips)
+                    with metrics.stage_timer("worker", "reply", timings):
+                        publish_result(self.channel, props, {"text": text})
+                        self.channel.basic_ack(delivery_tag = method.delivery_tag)
+                    metrics.REQUESTS.labels("worker", "ok").inc()
+                    metrics.log_request_timings("worker", props.correlation_id, timings)
+            except Exception:
+                metrics.REQUESTS.labels("worker", "error").inc(len(clips))
+                raise
+            finally:
+                metrics.IN_FLIGHT.labels("worker").dec(len(clips))
             
-        self.channel.basic_qos(prefetch_count=1)
+        # packing needs several unacked clips in hand at once
+        self.channel.basic_qos(prefetch_count=PACK_MAX_CLIPS if self.pack_enabled else 1)
         self.channel.basic_consume(queue="asr_queue", on_message_callback=callback)
-        print("Server side start listening...")
+        logger.info("Server side start listening...")
         self.channel.start_consuming()
 
 if __name__ == "__main__":
+    metrics.start_metrics_server(metrics.WORKER_METRICS_PORT)
     asr_backend = ASRServer()
     asr_backend.run()
         
@@ -5,7 +5,12 @@ import pika
 import uuid
 from typing import Dict, Optional, Any
 import threading
-from log import get_logger
+import time
+import os
+import signal
+import multiprocessing
+from log import get_logger, get_hot_logger
+import metrics
 
 
 """
@@ -22,6 +27,14 @@ TODO:
 """
 
 logger = get_logger()
+hot_logger = get_hot_logger()
+# >1: supervisor mode, N gateway processes share port 8765 via SO_REUSEPORT (Linux / BSD)
+GATEWAY_PROCESSES = int(os.environ.get("ASR_GATEWAY_PROCESSES", 1))
+GATEWAY_RESTART_DELAY_S = 1.0
+# a gateway that keeps dying right away (e.g. RabbitMQ down) is restarted with doubling delay up to this
+GATEWAY_MAX_RESTART_DELAY_S = 60.0
+# uptime after which a gateway counts as healthy again and its restart delay resets
+GATEWAY_HEALTHY_UPTIME_S = 30.0
 
 
 class ASRProducer:
@@ -39,6 +52,7 @@ class ASRProducer:
         
         self.build_consumer()
         self.build_publisher()
+        metrics.PENDING_FUTURES.set_function(self.get_dict_len)
         
     def loop_inject(self, loop: asyncio.events.AbstractEventLoop):
         self.__loop = loop
@@ -67,7 +81,6 @@ class ASRProducer:
         )
         self.callback_queue_name = result_queue.method.queue
         logger.info(f"Callback queue created: {self.callback_queue_name}")
-        print(f"Callback queue created: {self.callback_queue_name}")
         
         def on_response(ch, method, props, body):
             c_id = props.correlation_id
@@ -82,7 +95,6 @@ class ASRProducer:
             queue=self.callback_queue_name, on_message_callback=on_response, auto_ack=True,
         )
         logger.info("Pika pending for processed reuslt")
-        print("Pika pending for processed reuslt")
         self.consumer_channel.start_consuming()
         
     def publish_client_task(self, message, corr_id):
@@ -99,6 +111,7 @@ class ASRProducer:
                 properties=pika.BasicProperties(
                     reply_to=self.callback_queue_name,
                     correlation_id=corr_id,
+                    headers={metrics.PUBLISH_TS_HEADER: time.time()},
                 ),
                 body=message,
             )
@@ -106,30 +119,35 @@ class ASRProducer:
 async def websocket_handler(websocket):
     try:
         async for message in websocket:
-            logger.info("get user data")
-            print("get user data")
+            hot_logger.debug("get user data")
             corr_id = str(uuid.uuid4())
+            timings: Dict[str, float] = {}
+            request_start = time.perf_counter()
+            metrics.IN_FLIGHT.labels("gateway").inc()
             
             current_loop = asyncio.get_running_loop()
             future = current_loop.create_future()
             
             asr_websocket.loop_inject(current_loop)
             asr_websocket.add_new_map(corr_id, future)
-            logger.info(f"📤 [Send] correlation_id: {corr_id[:8]}..., pending tasks: {asr_websocket.get_dict_len()}")
-            print(f"📤 [Send] correlation_id: {corr_id[:8]}..., pending tasks: {asr_websocket.get_dict_len()}")
+            hot_logger.info(f"📤 [Send] correlation_id: {corr_id[:8]}..., pending tasks: {asr_websocket.get_dict_len()}")
             
-            # Key step: Send to RabbitMQ in thread pool (prevent blocking WebSocket)
-            await current_loop.run_in_executor(
-                None, 
-                asr_websocket.publish_client_task, 
-                message, 
-                corr_id
-            )
-            
-            # Wait for result (await suspends current task until Future is set)
-            result = await future
-            logger.info(f"📥 [Received] correlation_id: {corr_id[:8]}..., remaining: {asr_websocket.get_dict_len()}")
-            print(f"📥 [Received] correlation_id: {corr_id[:8]}..., remaining: {asr_websocket.get_dict_len()}")
+            try:
+                # Key step: Send to RabbitMQ in thread pool (prevent blocking WebSocket)
+                with metrics.stage_timer("gateway", "publish", timings):
+                    await current_loop.run_in_executor(
+                        None, 
+                        asr_websocket.publish_client_task, 
+                        message, 
+                        corr_id
+                    )
+                
+                # Wait for result (await suspends current task until Future is set)
+                with metrics.stage_timer("gateway", "wait_result", timings):
+                    result = await future
+            finally:
+                metrics.IN_FLIGHT.labels("gateway").dec()
+            hot_logger.info(f"📥 [Received] correlation_id: {corr_id[:8]}..., remaining: {asr_websocket.get_dict_len()}")
             
             # Ensure result is properly formatted as string for WebSocket
             if isinstance(result, bytes):
@@ -138,16 +156,23 @@ async def websocket_handler(websocket):
                 logger.error("Got warning, data is a dict-like object")
                 result = json.dumps(result)
             
-            await websocket.send(result)
+            with metrics.stage_timer("gateway", "send", timings):
+                await websocket.send(result)
+            timings["total"] = time.perf_counter() - request_start
+            metrics.STAGE_SECONDS.labels("gateway", "total").observe(timings["total"])
+            metrics.REQUESTS.labels("gateway", "ok").inc()
+            metrics.log_request_timings("gateway", corr_id, timings)
     except Exception as e:
+        metrics.REQUESTS.labels("gateway", "error").inc()
         logger.error(f"connection handler failed")
         logger.error(str(e))
         raise Exception(e)
 
 # 启动WebSocket服务器
-async def main():
+async def main(reuse_port: bool = False):
     # Set max_size to handle large audio payloads (default is 1MB, set to 10MB)
     # Set max_queue to limit memory usage per connection
+    # reuse_port: several gateway processes bind 8765, the kernel spreads connections over them
     async with websockets.serve(
         websocket_handler, 
         "0.0.0.0", 
@@ -155,27 +180,96 @@ async def main():
         max_size=10 * 1024 * 1024,  # 10MB max message size
         max_queue=32,  # Limit queued messages
         ping_interval=20,  # Keep connection alive
-        ping_timeout=20
+        ping_timeout=20,
+        reuse_port=reuse_port,
     ):
-        logger.info("server listening on 0.0.0.0:8765")
-        print("[网关] WebSocket网关已在 ws://0.0.0.0:8765 启动")
+        logger.info(f"server listening on 0.0.0.0:8765 (pid {os.getpid()})")
         await asyncio.Future() 
-        
 
-if __name__ == "__main__":
+
+def run_gateway(index: int = 0, reuse_port: bool = False, metrics_port: int = metrics.GATEWAY_METRICS_PORT):
+    """One gateway process: own pika connections, own exclusive callback queue and future map"""
+    global asr_websocket
+    metrics.start_metrics_server(metrics_port)
     asr_websocket = ASRProducer()
     listen_thread = threading.Thread(target=asr_websocket.listening_on_feedback, daemon=True)
     listen_thread.start()  # Fix: Start the listener thread!
     logger.info("RabbitMQ listener thread started")
-    print("RabbitMQ listener thread started")
     
     try:
-        asyncio.run(main())
+        asyncio.run(main(reuse_port))
     except KeyboardInterrupt:
         logger.info("\nServer stopped by user")
-        print("\nServer stopped by user")
     finally:
         asr_websocket.publish_connection.close()
         asr_websocket.consumer_connection.close()
         logger.info("Connections closed")
-        print("Connections closed")
+
+
+def supervise(num_processes: int):
+    """Start num_processes gateways on the same port with SO_REUSEPORT, restart any that exits"""
+    metrics_ports = range(metrics.GATEWAY_METRICS_PORT_BASE, metrics.GATEWAY_METRICS_PORT_BASE + num_processes)
+    if metrics.WORKER_METRICS_PORT in metrics_ports:
+        # the worker (or a gateway) would fail to bind, and a crash-looping gateway hides it behind restarts
+        raise ValueError(f"Gateway metrics ports {metrics_ports.start}-{metrics_ports.stop - 1} include "
+                         f"ASR_WORKER_METRICS_PORT={metrics.WORKER_METRICS_PORT}, "
+                         f"move ASR_GATEWAY_METRICS_PORT_BASE")
+    ctx = multiprocessing.get_context("spawn")
+    workers: Dict[int, Any] = {}
+    started_at: Dict[int, float] = {}
+    restart_delays: Dict[int, float] = {}
+    restart_at: Dict[int, float] = {}
+    
+    def spawn(index: int):
+        process = ctx.Process(target=run_gateway, args=(index, True, metrics.GATEWAY_METRICS_PORT_BASE + index),
+                              name=f"gateway-{index}", daemon=True)
+        process.start()
+        workers[index] = process
+        started_at[index] = time.monotonic()
+        logger.info(f"Gateway process {index} started, pid {process.pid}")
+    
+    def handle_sigterm(sig, frame):
+        # kill / systemd stop: unwind through finally so the children are stopped too,
+        # otherwise they keep serving 8765 next to the next supervisor's gateways
+        raise SystemExit(0)
+    
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    for index in range(num_processes):
+        spawn(index)
+    try:
+        while True:
+            time.sleep(GATEWAY_RESTART_DELAY_S)
+            now = time.monotonic()
+            for index, process in list(workers.items()):
+                if process.is_alive():
+                    continue
+                if index not in restart_at:
+                    if now - started_at[index] >= GATEWAY_HEALTHY_UPTIME_S:
+                        restart_delays[index] = GATEWAY_RESTART_DELAY_S
+                    else:
+                        previous = restart_delays.get(index, GATEWAY_RESTART_DELAY_S / 2)
+                        restart_delays[index] = min(previous * 2, GATEWAY_MAX_RESTART_DELAY_S)
+                    restart_at[index] = now + restart_delays[index]
+                    logger.warning(f"Gateway process {index} (pid {process.pid}) exited with {process.exitcode}, "
+                                   f"restarting in {restart_delays[index]:.0f}s")
+                elif now >= restart_at[index]:
+                    del restart_at[index]
+                    spawn(index)
+    except KeyboardInterrupt:
+        logger.info("Supervisor stopped by user")
+    finally:
+        logger.info("Stopping gateway processes")
+        for process in workers.values():
+            process.terminate()
+        for process in workers.values():
+            process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+
+if __name__ == "__main__":
+    if GATEWAY_PROCESSES > 1:
+        supervise(GATEWAY_PROCESSES)
+    else:
+        run_gateway()
@@ -5,13 +5,37 @@ import asyncio
 import websockets
 import json
 import time
-from datasets import load_dataset
 import base64
-import pyaudio
 import numpy as np
+from corpus_pack import CorpusPack, DEFAULT_CORPUS_DIR
 
-test_dataset = load_dataset("hf-internal-testing/librispeech_asr_dummy", "clean", split="validation")
 CHUNK_SIZE = 1
+_test_dataset = None
+
+def get_test_dataset():
+    """优先使用本地 corpus pack（内存映射、已预编码），没有时才回退到 HuggingFace 数据集"""
+    global _test_dataset
+    if _test_dataset is None:
+        if CorpusPack.exists(DEFAULT_CORPUS_DIR):
+            _test_dataset = CorpusPack(DEFAULT_CORPUS_DIR)
+        else:
+            from datasets import load_dataset
+            _test_dataset = load_dataset("hf-internal-testing/librispeech_asr_dummy", "clean", split="validation")
+    return _test_dataset
+
+def build_request(sample) -> str:
+    """构造发送给网关的 JSON；corpus pack 样本直接拼接预编码的 base64，不再转换和编码音频"""
+    meta = {
+        "action": "asr",
+        "sample_rate": sample['audio']['sampling_rate'],
+        "id": sample['id'],
+        "timestamp": time.time(),
+        "data_type": "np.float32",
+    }
+    if "audio_b64" in sample:
+        return json.dumps(meta)[:-1] + ', "audio": "' + sample["audio_b64"] + '"}'
+    meta["audio"] = base64.b64encode(sample['audio']['array'].astype(np.float32).tobytes()).decode('utf-8')
+    return json.dumps(meta)
 
 async def single_request_test(sample):
     """测试单个请求"""
@@ -21,19 +45,11 @@ async def single_request_test(sample):
     try:
         async with websockets.connect(uri) as websocket:
             # 获取测试数据
-            audio_data = sample['audio']
-            audio_array, audio_sample_rate = audio_data['array'].astype(np.float32), audio_data['sampling_rate']
+            audio_sample_rate = sample['audio']['sampling_rate']
             print(audio_sample_rate, "audio sampling rate")
             
             # 发送测试音频数据
-            test_data = json.dumps({
-                "action": "asr",
-                "audio": base64.b64encode(audio_array.tobytes()).decode('utf-8'),
-                "sample_rate": audio_sample_rate,
-                "id": sample['id'],
-                "timestamp": time.time(),
-                "data_type": "np.float32",
-            })
+            test_data = build_request(sample)
             
             print(f"发送: {sample['id']} (sample_rate: {audio_sample_rate} Hz)")
             await websocket.send(test_data)
@@ -57,21 +73,12 @@ async def concurrent_requests_test(data):
             async with websockets.connect(uri) as websocket:
                 # Extract data from the sample WITHOUT modifying original
                 client_id: str = sample['id']
-                raw_audio = sample['audio']
-                audio_array, audio_sample_rate = raw_audio['array'].astype(np.float32), raw_audio['sampling_rate']
                 
-                # Create a NEW clean dictionary for JSON serialization
-                request_data = {
-                    "action": "asr",
-                    "audio": base64.b64encode(audio_array.tobytes()).decode('utf-8'),
-                    "sample_rate": audio_sample_rate,
-                    "id": client_id,
-                    "timestamp": time.time(),
-                    "data_type": "np.float32",
-                }
+                # Create a NEW clean JSON payload, sample itself is not modified
+                request_data = build_request(sample)
                 
                 start_time = time.time()
-                await websocket.send(json.dumps(request_data))
+                await websocket.send(request_data)
                 response = await websocket.recv()
                 response = json.loads(response)
                 
@@ -99,6 +106,7 @@ async def main():
     print()
     
     # 测试1: 单个请求
+    test_dataset = get_test_dataset()
     sample = test_dataset[0]
     await single_request_test(sample=sample)
     await asyncio.sleep(1)
@@ -112,31 +120,23 @@ async def main():
     print("=" * 60)
 
 # === 新增: 供 API 调用的封装函数 ===
-async def run_batch_test_for_api(num_samples: int = 10):
+async def run_batch_test_for_api(num_samples: int = 10, on_result=None, max_concurrency: int = 32, on_start=None):
     """
     供 frontend_api.py 调用的批量测试函数
     返回结果列表，不打印到控制台
+    
+    on_result: 若提供，每个请求完成时立即回调 on_result(result)，不再在内存中累积结果（返回空列表）
+    max_concurrency: 固定数量的 worker 协程依次领取样本序号，内存不随样本数增长
+    on_start: 若提供，数据集加载后回调 on_start(实际请求数)，用于显示真实进度
     """
     uri = "ws://localhost:8765"
     results = []
     
-    async def send_request(sample):
+    async def request_once(sample):
+        client_id = sample['id']
         try:
             async with websockets.connect(uri) as websocket:
-                client_id = sample['id']
-                audio_data = sample['audio']
-                audio_array, audio_sample_rate = audio_data['array'].astype(np.float32), audio_data['sampling_rate']
-                
-                request_data = {
-                    "action": "asr",
-                    "audio": base64.b64encode(audio_array.tobytes()).decode('utf-8'),
-                    "sample_rate": audio_sample_rate,
-                    "id": client_id,
-                    "timestamp": time.time(),
-                    "data_type": "np.float32",
-                }
-                
-                await websocket.send(json.dumps(request_data))
+                await websocket.send(build_request(sample))
                 response = await websocket.recv()
                 response = json.loads(response)
                 
@@ -152,11 +152,30 @@ async def run_batch_test_for_api(num_samples: int = 10):
                 "ground_truth": sample['text']
             }
     
+    async def worker(indices):
+        # 所有 worker 共用同一个迭代器，每个序号只被领取一次；用到时才读取样本
+        for index in indices:
+            result = await request_once(test_dataset[index])
+            if on_result is not None:
+                on_result(result)
+            else:
+                results.append((index, result))
+    
+    # 没有 corpus pack 时会走阻塞的 load_dataset，放到线程池里，不卡住 FastAPI 事件循环
+    test_dataset = await asyncio.get_running_loop().run_in_executor(None, get_test_dataset)
     num_requests = min(num_samples, len(test_dataset))
-    tasks = [send_request(test_dataset[i]) for i in range(num_requests)]
-    results = await asyncio.gather(*tasks)
+    if on_start is not None:
+        on_start(num_requests)
+    indices = iter(range(num_requests))
+    workers = [asyncio.ensure_future(worker(indices)) for _ in range(min(max_concurrency, num_requests))]
+    try:
+        await asyncio.gather(*workers)
+    except asyncio.CancelledError:
+        for task in workers:
+            task.cancel()
+        raise
     
-    return results
+    return [result for _, result in sorted(results, key=lambda item: item[0])]
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,126 @@
+import os
+
+# offline evaluation, never touch the HuggingFace hub
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+import argparse
+import itertools
+import json
+import re
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from ASR_cascade import needs_escalation
+from ASR_model import ASRModel
+from corpus_pack import CorpusPack, DEFAULT_CORPUS_DIR
+from log import get_logger
+
+"""
+Offline WER / throughput tradeoff of the tiny -> small cascade on a local corpus pack.
+
+Each model transcribes every clip once; every threshold pair is then evaluated from those
+results (a cascaded clip costs tiny time, plus small time when escalated), so the sweep is cheap.
+
+    python cascade_eval.py --corpus corpus/librispeech_dummy \
+        --fast-model-dir ASR_model/openai-whisper-tiny --accurate-model-dir ASR_model/openai-whisper-small \
+        --logprob-thresholds -0.3 -0.5 -0.7 -1.0 --compression-thresholds 2.4
+"""
+
+logger = get_logger()
+
+
+def normalize(text: str) -> List[str]:
+    text = re.sub(r"[^\w\s']", " ", text.lower())
+    return text.split()
+
+
+def word_errors(reference: str, hypothesis: str) -> int:
+    """Word-level Levenshtein distance"""
+    ref, hyp = normalize(reference), normalize(hypothesis)
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1]
+
+
+def transcribe_all(asr: ASRModel, pack: CorpusPack, with_quality: bool) -> List[Dict[str, Any]]:
+    rows = []
+    for index in range(len(pack)):
+        entry = pack.manifest[index]
+        quality: Optional[Dict[str, float]] = {} if with_quality else None
+        start = time.perf_counter()
+        text = asr.process(pack.audio(index), entry["sample_rate"], quality=quality)
+        rows.append({"text": text, "seconds": time.perf_counter() - start, "quality": quality})
+    return rows
+
+
+def summarize(name: str, pack: CorpusPack, texts: List[str], seconds: float, escalated: Optional[int] = None) -> Dict[str, Any]:
+    errors = sum(word_errors(entry["text"], text) for entry, text in zip(pack.manifest, texts))
+    words = sum(len(normalize(entry["text"])) for entry in pack.manifest)
+    audio_seconds = sum(entry["length"] / entry["sample_rate"] for entry in pack.manifest)
+    summary = {
+        "config": name,
+        "clips": len(pack),
+        "wer": errors / words if words else 0.0,
+        "compute_s": seconds,
+        "rtf": seconds / audio_seconds if audio_seconds else 0.0,
+        "audio_s_per_compute_s": audio_seconds / seconds if seconds else 0.0,
+    }
+    if escalated is not None:
+        summary["escalation_rate"] = escalated / len(pack) if len(pack) else 0.0
+    return summary
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline cascade WER / throughput evaluation")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS_DIR, help="corpus pack with transcripts")
+    parser.add_argument("--fast-model-dir", default="ASR_model/openai-whisper-tiny")
+    parser.add_argument("--accurate-model-dir", default="ASR_model/openai-whisper-small")
+    parser.add_argument("--logprob-thresholds", type=float, nargs="+", default=[-0.3, -0.5, -0.7, -1.0])
+    parser.add_argument("--compression-thresholds", type=float, nargs="+", default=[2.4])
+    parser.add_argument("--output", default=None, help="JSON lines file, stdout if omitted")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    pack = CorpusPack(args.corpus)
+    fast_rows = transcribe_all(ASRModel(os.path.abspath(args.fast_model_dir), local_files_only=True), pack, True)
+    accurate_rows = transcribe_all(ASRModel(os.path.abspath(args.accurate_model_dir), local_files_only=True), pack, False)
+
+    results = [
+        summarize("fast_only", pack, [r["text"] for r in fast_rows], sum(r["seconds"] for r in fast_rows)),
+        summarize("accurate_only", pack, [r["text"] for r in accurate_rows], sum(r["seconds"] for r in accurate_rows)),
+    ]
+    for logprob_threshold, compression_threshold in itertools.product(args.logprob_thresholds, args.compression_thresholds):
+        texts, seconds, escalated = [], 0.0, 0
+        for fast, accurate in zip(fast_rows, accurate_rows):
+            seconds += fast["seconds"]
+            if needs_escalation(fast["quality"], logprob_threshold, compression_threshold):
+                escalated += 1
+                seconds += accurate["seconds"]
+                texts.append(accurate["text"])
+            else:
+                texts.append(fast["text"])
+        name = f"cascade logprob<{logprob_threshold} compression>{compression_threshold}"
+        result = summarize(name, pack, texts, seconds, escalated)
+        result.update({"logprob_threshold": logprob_threshold, "compression_threshold": compression_threshold})
+        results.append(result)
+
+    out = open(args.output, "a") if args.output else sys.stdout
+    try:
+        for result in results:
+            logger.info(f"cascade_eval {json.dumps(result)}")
+            out.write(json.dumps(result) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ import numpy as np
 import time
 import base64
 import json
+import uuid
 
 
 CHUNK_DURATION_MS = 100
@@ -25,6 +26,8 @@ async def real_speech():
     stream transmission while not be considered to implement now.
     """
     uri = "ws://localhost:8765"
+    # server keeps language / previous transcript per session_id across chunks
+    session_id = str(uuid.uuid4())
     p = pyaudio.PyAudio()
     
     # Find available input device
@@ -107,6 +110,7 @@ async def real_speech():
                             "timestamp": current_time,
                             "data_type": "np.float32",
                             "duration": total_accumulated_duration,
+                            "session_id": session_id,
                         })
                         await websocket.send(message)
                         
@@ -1,13 +1,13 @@
-import pyaudio
 import asyncio
 import websockets
 import numpy as np
 import time
 import base64
 import json
+import uuid
 import signal
 import sys
-from log import get_logger
+from log import get_logger, get_hot_logger
 
 CHUNK_DURATION_MS = 100
 RATE = 16000
@@ -17,14 +17,114 @@ SILENCE_DURATION = 2.0
 SEND_INTERVAL = 5.0
 RESULTS_FILE = "realtime_results.txt"
 logger = get_logger()
+hot_logger = get_hot_logger()
 
 # 信号处理：优雅退出
 def signal_handler(sig, frame):
-    print("Stopping real-time ASR...")
+    logger.info("Stopping real-time ASR...")
     sys.exit(0)
 
-signal.signal(signal.SIGTERM, signal_handler)
-signal.signal(signal.SIGINT, signal_handler)
+async def speech_loop(websocket, read_chunk, session_id: str, on_result, max_session_s: float = 600):
+    """
+    chunk / VAD / send loop, shared by the microphone client and virtual_microphone.py
+    
+    read_chunk: async callable, returns CHUNK_SIZE int16 frames as bytes, or None when the input ends
+    on_result: on_result(result, info) for every server reply,
+        info = {"timestamp": send time, "received_at": reply time, "duration": seconds of audio sent}
+    
+    Returns when the input ends or max_session_s is reached; connection and send / recv errors
+    are raised to the caller.
+    """
+    # Time tracking variables
+    last_sound_time = time.time()
+    is_speaking = False
+    temporally_time = time.time()
+    
+    # Audio accumulation variables
+    accumulated_audio = []  # List to store audio chunks
+    accumulation_start_time = time.time()  # Track when accumulation started
+    total_accumulated_duration = 0.0  # Track accumulated duration in seconds
+    
+    while True:
+        try:
+            data = await read_chunk()
+            if data is None:
+                logger.info("Audio input ended.")
+                break
+            audio_np = np.frombuffer(data, dtype=np.int16)
+            volume = np.linalg.norm(audio_np) / np.sqrt(len(audio_np))
+            
+            audio_np = (audio_np).astype(np.float32) / 32768.0  # Normalize to [-1.0, 1.0]
+            
+            if volume > SILENCE_THRESHOLD:
+                last_sound_time = time.time()
+                is_speaking = True
+            
+            else:
+                # 在状态标记为讲话但长时间无声音，则认为讲话结束
+                if is_speaking and (time.time() - last_sound_time) > SILENCE_DURATION:
+                    logger.debug("Silence detected, stopping accumulation.")
+                    is_speaking = False
+            
+            # Accumulate audio chunks when speaking
+            if is_speaking or volume > SILENCE_THRESHOLD:
+                accumulated_audio.append(audio_np)
+                chunk_duration = len(audio_np) / RATE  # Duration of this chunk in seconds
+                total_accumulated_duration += chunk_duration
+                
+                current_time = time.time()
+                elapsed_since_start = current_time - accumulation_start_time
+                
+                # Check if it's time to send (every SEND_INTERVAL seconds)
+                if elapsed_since_start >= SEND_INTERVAL:
+                    # Concatenate all accumulated chunks
+                    combined_audio = np.concatenate(accumulated_audio)
+                    hot_logger.info(f"Current volume is {volume:.2f}")
+                    hot_logger.info(f"Sending {total_accumulated_duration:.2f}s of audio ({len(accumulated_audio)} chunks)")
+                    
+                    encoded_audio = base64.b64encode(combined_audio.tobytes()).decode('utf-8')
+                    message = json.dumps({
+                        "action": "asr",
+                        "audio": encoded_audio,
+                        "sample_rate": 16_000,
+                        "id": f"speech_{int(current_time)}",
+                        "timestamp": current_time,
+                        "data_type": "np.float32",
+                        "duration": total_accumulated_duration,
+                        "session_id": session_id,
+                    })
+                    await websocket.send(message)
+                    
+                    # Wait for response
+                    result = await websocket.recv()
+                    result = json.loads(result)
+                    hot_logger.info(f"Received from server: {result}")
+                    on_result(result, {
+                        "timestamp": current_time,
+                        "received_at": time.time(),
+                        "duration": total_accumulated_duration,
+                    })
+                    
+                    # Reset accumulation
+                    accumulated_audio = []
+                    accumulation_start_time = time.time()
+                    total_accumulated_duration = 0.0
+            
+            if time.time() - temporally_time > max_session_s:
+                logger.info(f"Ending session after {max_session_s:.0f} seconds.")
+                break
+            
+        finally:
+            await asyncio.sleep(0.01)  # Slight delay to prevent CPU overload
+
+def write_result(result, info):
+    # 写入结果到文件
+    with open(RESULTS_FILE, "a") as f:
+        f.write(json.dumps({
+            "timestamp": info["timestamp"],
+            "text": result.get("text", ""),
+            "duration": info["duration"]
+        }) + "\n")
 
 async def real_speech():
     """
@@ -35,8 +135,12 @@ async def real_speech():
     3. user manual control (press a key to start/stop)
     
     stream transmission while not be considered to implement now.
+    headless boxes without an input device: see virtual_microphone.py
     """
+    import pyaudio
     uri = "ws://localhost:8765"
+    # server keeps language / previous transcript per session_id across chunks
+    session_id = str(uuid.uuid4())
     p = pyaudio.PyAudio()
     
     # Find available input device
@@ -45,11 +149,11 @@ async def real_speech():
         device_info = p.get_device_info_by_index(i)
         if device_info['maxInputChannels'] > 0:
             input_device_index = i
-            print(f"Using input device {i}: {device_info['name']}")
+            logger.info(f"Using input device {i}: {device_info['name']}")
             break
     
     if input_device_index is None:
-        print("No input device found. This might be a WSL issue.")
+        logger.error("No input device found. This might be a WSL issue.")
         p.terminate()
         return
     
@@ -61,94 +165,17 @@ async def real_speech():
                     input = True,
                     frames_per_buffer = CHUNK_SIZE,) # 底层缓冲池，声卡驱动存录了多少数据
     
-    # Time tracking variables
-    last_sound_time = time.time()
-    is_speaking = False
-    temporally_time = time.time()
-    
-    # Audio accumulation variables
-    accumulated_audio = []  # List to store audio chunks
-    accumulation_start_time = time.time()  # Track when accumulation started
-    total_accumulated_duration = 0.0  # Track accumulated duration in seconds
+    async def read_chunk():
+        # stream.read CHUNK_SIZE, 有多少数据要被取走，是跟着底层缓冲池来的，缓冲池满了才会往外取数据，所以最好两者设置一样, 至少 frames_per_buffer >= stream.read CHUNK_SIZE
+        return await loop.run_in_executor(None, stream.read, CHUNK_SIZE, False)
     
-    async with websockets.connect(uri) as websocket:
-        print("Connected to server. Start speaking...")
-        
-        while True:
-            try:
-                # stream.read CHUNK_SIZE, 有多少数据要被取走，是跟着底层缓冲池来的，缓冲池满了才会往外取数据，所以最好两者设置一样, 至少 frames_per_buffer >= stream.read CHUNK_SIZE
-                data = await loop.run_in_executor(None, stream.read,
-                                                  CHUNK_SIZE, False) 
-                audio_np = np.frombuffer(data, dtype=np.int16)
-                volume = np.linalg.norm(audio_np) / np.sqrt(len(audio_np))
-                
-                audio_np = (audio_np).astype(np.float32) / 32768.0  # Normalize to [-1.0, 1.0]
-                
-                if volume > SILENCE_THRESHOLD:
-                    last_sound_time = time.time()
-                    is_speaking = True
-                
-                else:
-                    # 在状态标记为讲话但长时间无声音，则认为讲话结束
-                    if is_speaking and (time.time() - last_sound_time) > SILENCE_DURATION:
-                        print("Silence detected, stopping accumulation.")
-                        is_speaking = False
-                
-                # Accumulate audio chunks when speaking
-                if is_speaking or volume > SILENCE_THRESHOLD:
-                    accumulated_audio.append(audio_np)
-                    chunk_duration = len(audio_np) / RATE  # Duration of this chunk in seconds
-                    total_accumulated_duration += chunk_duration
-                    
-                    current_time = time.time()
-                    elapsed_since_start = current_time - accumulation_start_time
-                    
-                    # Check if it's time to send (every SEND_INTERVAL seconds)
-                    if elapsed_since_start >= SEND_INTERVAL:
-                        # Concatenate all accumulated chunks
-                        combined_audio = np.concatenate(accumulated_audio)
-                        logger.info(f"Current volume is {volume:.2f}")
-                        print(f"Sending {total_accumulated_duration:.2f}s of audio ({len(accumulated_audio)} chunks)")
-                        
-                        encoded_audio = base64.b64encode(combined_audio.tobytes()).decode('utf-8')
-                        message = json.dumps({
-                            "action": "asr",
-                            "audio": encoded_audio,
-                            "sample_rate": 16_000,
-                            "id": f"speech_{int(current_time)}",
-                            "timestamp": current_time,
-                            "data_type": "np.float32",
-                            "duration": total_accumulated_duration,
-                        })
-                        await websocket.send(message)
-                        
-                        # Wait for response
-                        result = await websocket.recv()
-                        result = json.loads(result)
-                        print(f"Received from server: {result}")
-                        
-                        # 写入结果到文件
-                        with open(RESULTS_FILE, "a") as f:
-                            f.write(json.dumps({
-                                "timestamp": current_time,
-                                "text": result.get("text", ""),
-                                "duration": total_accumulated_duration
-                            }) + "\n")
-                        
-                        # Reset accumulation
-                        accumulated_audio = []
-                        accumulation_start_time = time.time()
-                        total_accumulated_duration = 0.0
-                
-                if time.time() - temporally_time > 600:
-                    print("Ending session after 5 minutes.")
-                    break
-                
-            except Exception as e:
-                print(f"Error: {e}")
-                break
-            finally:
-                await asyncio.sleep(0.01)  # Slight delay to prevent CPU overload
+    try:
+        async with websockets.connect(uri) as websocket:
+            logger.info("Connected to server. Start speaking...")
+            await speech_loop(websocket, read_chunk, session_id, write_result)
+    except Exception as e:
+        logger.error(f"Error: {e}")
+    finally:
         stream.stop_stream()
         stream.close()
         p.terminate()
@@ -157,5 +184,7 @@ async def main():
     await real_speech()
     
 if __name__ == "__main__":
+    signal.signal(signal.SIGTERM, signal_handler)
+    signal.signal(signal.SIGINT, signal_handler)
     asyncio.run(main())
     
\ No newline at end of file
@@ -0,0 +1,145 @@
+import argparse
+import base64
+import json
+import mmap
+import os
+import wave
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+"""
+Corpus pack: pre-decoded, pre-encoded benchmark audio for the dataset clients and benchmark tools.
+
+layout of a pack directory:
+    audio.f32       float32 PCM of every clip back to back, read through np.memmap (zero-copy views)
+    audio.b64       base64 of the same bytes per clip, so clients can send without re-encoding
+    manifest.jsonl  one line per clip: id, text, sample_rate, offset, length, b64_offset, b64_length
+
+build once (needs network or an HF cache only for --from-hf):
+    python corpus_pack.py --out corpus/librispeech_dummy --from-hf hf-internal-testing/librispeech_asr_dummy clean validation
+    python corpus_pack.py --out corpus/my_wavs --from-wav path/to/wavs
+"""
+
+DEFAULT_CORPUS_DIR = os.environ.get("ASR_CORPUS_DIR", "corpus/librispeech_dummy")
+AUDIO_FILE = "audio.f32"
+B64_FILE = "audio.b64"
+MANIFEST_FILE = "manifest.jsonl"
+
+
+def read_wav(path: str) -> Tuple[np.ndarray, int]:
+    """Read a 16-bit PCM wav as mono float32 in [-1.0, 1.0]"""
+    with wave.open(path, "rb") as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM wav is supported")
+        frames = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+        frames = frames.reshape(-1, wf.getnchannels()).mean(axis=1)
+        return (frames / 32768.0).astype(np.float32), wf.getframerate()
+
+
+def write_pack(out_dir: str, samples: Iterable[Dict[str, Any]]) -> int:
+    """samples: dicts with id, text, sample_rate and array (any float dtype)"""
+    os.makedirs(out_dir, exist_ok=True)
+    count = offset = b64_offset = 0
+    with open(os.path.join(out_dir, AUDIO_FILE), "wb") as audio_f, \
+            open(os.path.join(out_dir, B64_FILE), "wb") as b64_f, \
+            open(os.path.join(out_dir, MANIFEST_FILE), "w", encoding="utf-8") as manifest_f:
+        for sample in samples:
+            pcm = np.ascontiguousarray(sample["array"], dtype=np.float32)
+            encoded = base64.b64encode(pcm.tobytes())
+            audio_f.write(pcm.tobytes())
+            b64_f.write(encoded)
+            manifest_f.write(json.dumps({
+                "id": sample["id"],
+                "text": sample.get("text", ""),
+                "sample_rate": int(sample["sample_rate"]),
+                "offset": offset,
+                "length": len(pcm),
+                "b64_offset": b64_offset,
+                "b64_length": len(encoded),
+            }, ensure_ascii=False) + "\n")
+            offset += len(pcm)
+            b64_offset += len(encoded)
+            count += 1
+    return count
+
+
+def iter_hf_dataset(name: str, config: str, split: str) -> Iterator[Dict[str, Any]]:
+    from datasets import load_dataset
+    for sample in load_dataset(name, config, split=split):
+        yield {
+            "id": sample["id"],
+            "text": sample["text"],
+            "array": sample["audio"]["array"],
+            "sample_rate": sample["audio"]["sampling_rate"],
+        }
+
+
+def iter_wav_dir(wav_dir: str) -> Iterator[Dict[str, Any]]:
+    """Every *.wav in the directory, transcript from a sibling <name>.txt if present"""
+    for name in sorted(os.listdir(wav_dir)):
+        if not name.endswith(".wav"):
+            continue
+        stem = os.path.splitext(name)[0]
+        array, sample_rate = read_wav(os.path.join(wav_dir, name))
+        text_path = os.path.join(wav_dir, f"{stem}.txt")
+        text = ""
+        if os.path.exists(text_path):
+            with open(text_path, encoding="utf-8") as f:
+                text = f.read().strip()
+        yield {"id": stem, "text": text, "array": array, "sample_rate": sample_rate}
+
+
+class CorpusPack:
+    def __init__(self, pack_dir: str = DEFAULT_CORPUS_DIR):
+        self.pack_dir = pack_dir
+        with open(os.path.join(pack_dir, MANIFEST_FILE), encoding="utf-8") as f:
+            self.manifest: List[Dict[str, Any]] = [json.loads(line) for line in f if line.strip()]
+        audio_path = os.path.join(pack_dir, AUDIO_FILE)
+        # np.memmap refuses empty files
+        self.__audio = np.memmap(audio_path, dtype=np.float32, mode="r") if os.path.getsize(audio_path) else np.empty(0, np.float32)
+        b64_path = os.path.join(pack_dir, B64_FILE)
+        with open(b64_path, "rb") as f:
+            self.__b64 = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(b64_path) else b""
+
+    @staticmethod
+    def exists(pack_dir: str = DEFAULT_CORPUS_DIR) -> bool:
+        return os.path.exists(os.path.join(pack_dir, MANIFEST_FILE))
+
+    def __len__(self) -> int:
+        return len(self.manifest)
+
+    def audio(self, index: int) -> np.ndarray:
+        """Read-only float32 view into the memory map, no copy"""
+        entry = self.manifest[index]
+        return self.__audio[entry["offset"]:entry["offset"] + entry["length"]]
+
+    def audio_b64(self, index: int) -> str:
+        entry = self.manifest[index]
+        return self.__b64[entry["b64_offset"]:entry["b64_offset"] + entry["b64_length"]].decode("ascii")
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        """Same shape as a HuggingFace librispeech sample, plus the pre-encoded audio"""
+        entry = self.manifest[index]
+        return {
+            "id": entry["id"],
+            "text": entry["text"],
+            "audio": {"array": self.audio(index), "sampling_rate": entry["sample_rate"]},
+            "audio_b64": self.audio_b64(index),
+        }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Build a memory-mapped corpus pack")
+    parser.add_argument("--out", default=DEFAULT_CORPUS_DIR)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--from-hf", nargs=3, metavar=("NAME", "CONFIG", "SPLIT"))
+    source.add_argument("--from-wav", metavar="DIR")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    samples = iter_hf_dataset(*args.from_hf) if args.from_hf else iter_wav_dir(args.from_wav)
+    count = write_pack(args.out, samples)
+    print(f"{count} clips written to {args.out}")
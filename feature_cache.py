@@ -0,0 +1,155 @@
+import atexit
+import hashlib
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Optional, Tuple
+
+import numpy as np
+
+import metrics
+from log import get_logger, get_hot_logger
+
+"""
+On-disk cache of log-mel features and encoder hidden states, keyed by a hash of the audio.
+
+A redelivered task (worker crashed before ack) or replayed benchmark audio skips feature
+extraction and the encoder and goes straight to the decoder. Entries are .npy files read back
+with mmap_mode="r". Writes never run on the request path: put() hands the array to a background
+writer thread, which drops it when FEATURE_CACHE_WRITE_QUEUE writes are already waiting.
+Queued writes are flushed at interpreter exit, including a worker exiting on an exception.
+
+FEATURE_CACHE_MAX_MB bounds the whole directory, also when several workers share it: after
+every write the directory is re-scanned and the least recently used files (by mtime, hits
+touch the file) are removed.
+
+    ASR_FEATURE_CACHE_DIR          cache directory, caching is off when unset
+    ASR_FEATURE_CACHE_MAX_MB       size bound of the directory (default 2048)
+    ASR_FEATURE_CACHE_WRITE_QUEUE  pending background writes before new ones are dropped (default 16)
+"""
+
+FEATURE_CACHE_DIR = os.environ.get("ASR_FEATURE_CACHE_DIR", "")
+FEATURE_CACHE_MAX_MB = float(os.environ.get("ASR_FEATURE_CACHE_MAX_MB", 2048))
+FEATURE_CACHE_WRITE_QUEUE = int(os.environ.get("ASR_FEATURE_CACHE_WRITE_QUEUE", 16))
+# temp files older than this are leftovers of a crashed writer
+STALE_TMP_S = 600.0
+# longest the interpreter waits at exit for queued writes
+EXIT_FLUSH_TIMEOUT_S = 30.0
+logger = get_logger()
+hot_logger = get_hot_logger()
+
+
+class FeatureCache:
+    def __init__(self, cache_dir: str = FEATURE_CACHE_DIR, max_mb: float = FEATURE_CACHE_MAX_MB,
+                 write_queue: int = FEATURE_CACHE_WRITE_QUEUE):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 ** 2)
+        os.makedirs(cache_dir, exist_ok=True)
+        self.__writes: "queue.Queue[Tuple[str, np.ndarray]]" = queue.Queue(maxsize=max(1, write_queue))
+        self.__writer = threading.Thread(target=self.__write_loop, name="feature-cache-writer", daemon=True)
+        self.__writer.start()
+        # the writer is a daemon thread: a worker dying on an exception (e.g. in generate()) must
+        # still get the encoder state it just queued to disk, that is the redelivery case
+        atexit.register(self.flush, EXIT_FLUSH_TIMEOUT_S)
+        entries, total = self.evict()
+        logger.info(f"Feature cache at {cache_dir}: {entries} entries, {total / 1024 ** 2:.1f} MB")
+
+    @staticmethod
+    def audio_key(audio: np.ndarray, sp_rate: float) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(np.ascontiguousarray(audio, dtype=np.float32).data)
+        digest.update(str(sp_rate).encode())
+        return digest.hexdigest()
+
+    def get(self, name: str) -> Optional[np.ndarray]:
+        """Memory-mapped array, or None on a miss"""
+        path = os.path.join(self.cache_dir, name)
+        cache = name.rsplit(".", 2)[-2]
+        try:
+            array = np.load(path, mmap_mode="r")
+            # mtime is the LRU clock shared by every process using the directory
+            os.utime(path)
+        except FileNotFoundError:
+            metrics.CACHE_MISSES.labels(cache).inc()
+            return None
+        except (OSError, ValueError):
+            # torn or foreign file
+            self.discard(name)
+            metrics.CACHE_MISSES.labels(cache).inc()
+            return None
+        metrics.CACHE_HITS.labels(cache).inc()
+        return array
+
+    def put(self, name: str, array: np.ndarray):
+        """Queue a write; `array` must not be modified afterwards (pass a copy of reused buffers)"""
+        try:
+            self.__writes.put_nowait((name, array))
+        except queue.Full:
+            hot_logger.warning(f"Feature cache writer behind, dropped {name}")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every queued write is on disk, returns False if timeout ran out first"""
+        with self.__writes.all_tasks_done:
+            done = self.__writes.all_tasks_done.wait_for(lambda: not self.__writes.unfinished_tasks, timeout)
+        if not done:
+            logger.warning(f"Feature cache flush timed out, {self.__writes.unfinished_tasks} write(s) not on disk")
+        return done
+
+    def write(self, name: str, array: np.ndarray):
+        path = os.path.join(self.cache_dir, name)
+        # write then rename, so readers never see a half-written file
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Feature cache write failed for {name}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def discard(self, name: str):
+        try:
+            os.remove(os.path.join(self.cache_dir, name))
+        except FileNotFoundError:
+            pass
+
+    def evict(self) -> Tuple[int, int]:
+        """Remove least recently used files until the directory fits max_bytes, returns (entries, bytes) kept"""
+        now = time.time()
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.endswith(".npy"):
+                    entries.append((stat.st_mtime, entry.name, stat.st_size))
+                elif entry.name.endswith(".tmp") and now - stat.st_mtime > STALE_TMP_S:
+                    self.discard(entry.name)
+        entries.sort()
+        total = sum(size for _, _, size in entries)
+        kept = len(entries)
+        for _, name, size in entries:
+            if total <= self.max_bytes:
+                break
+            self.discard(name)
+            total -= size
+            kept -= 1
+        return kept, total
+
+    def __write_loop(self):
+        while True:
+            name, array = self.__writes.get()
+            try:
+                self.write(name, array)
+                self.evict()
+            except Exception as e:
+                logger.warning(f"Feature cache writer error: {e}")
+            finally:
+                self.__writes.task_done()
@@ -78,26 +78,42 @@ btnBatchTest.addEventListener('click', async () => {
     const data = await response.json();
     
     const taskId = data.task_id;
-    areaBatchTest.innerHTML = `<h3>批量测试结果</h3><p class="status">任务ID: ${taskId}<br>正在处理...</p>`;
+    areaBatchTest.innerHTML = `<h3>批量测试结果</h3><p class="status" id="batch-status">任务ID: ${taskId}<br>正在处理...</p><div id="batch-results"></div>`;
+    const statusEl = document.getElementById('batch-status');
+    const resultsEl = document.getElementById('batch-results');
     
-    // 轮询获取结果
+    // 增量轮询：每次只拉取 next_offset 之后的新结果
+    let offset = 0;
     const checkResult = async () => {
-        const res = await fetch(`${API_BASE}/api/asr/batch-test/${taskId}`);
+        const res = await fetch(`${API_BASE}/api/asr/batch-test/${taskId}?offset=${offset}&limit=100`);
         const result = await res.json();
         
-        if (result.status === 'completed') {
-            let html = '<h3>批量测试结果</h3>';
-            result.results.forEach((item, idx) => {
-                html += `<div class="result-item">
-                    <strong>#${idx + 1}</strong><br>
-                    识别: ${item.recognized}<br>
-                    真实: ${item.ground_truth}
-                </div>`;
-            });
-            areaBatchTest.innerHTML = html;
+        if (result.error && !result.status) {
+            statusEl.innerHTML = `❌ ${result.error}`;
+            return;
+        }
+        result.results.forEach((item, idx) => {
+            resultsEl.insertAdjacentHTML('beforeend', `<div class="result-item">
+                <strong>#${offset + idx + 1}</strong><br>
+                识别: ${item.recognized}<br>
+                真实: ${item.ground_truth}
+            </div>`);
+        });
+        offset = result.next_offset;
+        
+        if (offset < result.completed) {
+            // 先拉完剩余结果（包括失败 / 取消的任务），再显示最终状态
+            statusEl.innerHTML = `任务ID: ${taskId}<br>进度: ${result.completed}/${result.total} (${result.progress}%)`;
+            setTimeout(checkResult, 0);
         } else if (result.status === 'failed') {
-            areaBatchTest.innerHTML = `<h3>批量测试结果</h3><p class="status" style="color: red;">❌ 测试失败<br><br>错误信息:<br>${result.error}</p>`;
+            statusEl.style.color = 'red';
+            statusEl.innerHTML = `❌ 测试失败<br><br>错误信息:<br>${result.error}`;
+        } else if (result.status === 'cancelled') {
+            statusEl.innerHTML = `任务已取消 (${result.completed}/${result.total})`;
+        } else if (result.status === 'completed') {
+            statusEl.innerHTML = `已完成 ${result.completed}/${result.total}`;
         } else {
+            statusEl.innerHTML = `任务ID: ${taskId}<br>进度: ${result.completed}/${result.total} (${result.progress}%)`;
             setTimeout(checkResult, 2000);
         }
     };
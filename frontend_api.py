@@ -3,10 +3,10 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import asyncio
-import uuid
 import subprocess
 import os
 import json
+from job_store import BatchJobStore
 
 app = FastAPI()
 
@@ -18,8 +18,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 任务存储
-tasks = {}
+# 任务存储（TTL + 数量上限，结果按完成顺序写入磁盘）
+job_store = BatchJobStore()
 real_time_process = None
 
 class BatchTestRequest(BaseModel):
@@ -44,10 +44,12 @@ async def start_real_time():
         f.write("")
     
     # 启动进程
+    # stdout/stderr are never read, keep the client's log echo off so the pipes cannot fill up
     real_time_process = subprocess.Popen(
         ["python", "client_real_mimic_api.py"],
         stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
+        stderr=subprocess.PIPE,
+        env={**os.environ, "ASR_LOG_CONSOLE": "0"},
     )
     
     return {"status": "started", "pid": real_time_process.pid}
@@ -88,32 +90,46 @@ async def get_real_time_results():
 
 @app.post("/api/asr/batch-test")
 async def start_batch_test(request: BatchTestRequest):
-    task_id = str(uuid.uuid4())
-    tasks[task_id] = {"status": "running", "progress": 0, "results": []}
+    job = job_store.create(request.num_samples)
     
     # 在后台运行批量测试
-    asyncio.create_task(run_batch_test(task_id, request.num_samples))
+    job.task = asyncio.create_task(run_batch_test(job))
     
-    return {"task_id": task_id, "status": "started"}
+    return {"task_id": job.task_id, "status": "started"}
 
 @app.get("/api/asr/batch-test/{task_id}")
-async def get_batch_test_status(task_id: str):
-    if task_id not in tasks:
+async def get_batch_test_status(task_id: str, offset: int = 0, limit: int = 50):
+    """任务进度 + 分页结果，前端用 next_offset 增量拉取"""
+    job = job_store.get(task_id)
+    if job is None:
         return {"error": "Task not found"}
-    return tasks[task_id]
+    offset = max(0, offset)
+    results = job.results(offset, min(max(0, limit), 500))
+    return {**job.summary(), "offset": offset, "results": results, "next_offset": offset + len(results)}
 
-async def run_batch_test(task_id: str, num_samples: int):
+@app.post("/api/asr/batch-test/{task_id}/cancel")
+async def cancel_batch_test(task_id: str):
+    job = job_store.cancel(task_id)
+    if job is None:
+        return {"error": "Task not found"}
+    return job.summary()
+
+async def run_batch_test(job):
     """运行批量测试任务"""
     # 导入测试函数
     from auto_dataset_client_mimic import run_batch_test_for_api
     
+    def set_total(total):
+        # 样本数可能少于请求数，数据集加载后立即改为实际数量，进度才准确
+        job.total = total
+    
     try:
-        results = await run_batch_test_for_api(num_samples)
-        tasks[task_id]["status"] = "completed"
-        tasks[task_id]["results"] = results
+        await run_batch_test_for_api(job.total, on_result=job.append_result, on_start=set_total)
+        job.finish("completed")
+    except asyncio.CancelledError:
+        job.finish("cancelled")
     except Exception as e:
-        tasks[task_id]["status"] = "failed"
-        tasks[task_id]["error"] = str(e)
+        job.finish("failed", str(e))
 
 if __name__ == "__main__":
     import uvicorn
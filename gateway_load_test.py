@@ -0,0 +1,114 @@
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import websockets
+
+"""
+Connection-capacity load test for the WebSocket gateway (ASR_websockets.py).
+
+Opens --connections concurrent connections, keeps them all open and measures how fast the gateway
+accepts them and answers WebSocket pings (gateway event loop only, no worker involved).
+With --requests, every connection also sends that many ASR tasks from the corpus pack, which
+measures end-to-end throughput including the broker and the worker.
+
+compare 1 vs N gateway processes:
+    ASR_GATEWAY_PROCESSES=1 python ASR_websockets.py   ->  python gateway_load_test.py --label 1proc
+    ASR_GATEWAY_PROCESSES=4 python ASR_websockets.py   ->  python gateway_load_test.py --label 4proc
+"""
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "max": float(max(values))}
+
+
+async def run_connection(uri: str, pings: int, requests: int, start_barrier: asyncio.Event,
+                         stats: Dict[str, Any]):
+    t0 = time.perf_counter()
+    try:
+        websocket = await websockets.connect(uri, max_size=10 * 1024 * 1024, open_timeout=30)
+    except Exception as e:
+        stats["connect_errors"].append(type(e).__name__)
+        return
+    stats["connect_s"].append(time.perf_counter() - t0)
+    try:
+        # every connection is open before measuring, so the gateway holds them all at once
+        await start_barrier.wait()
+        for _ in range(pings):
+            t1 = time.perf_counter()
+            pong = await websocket.ping()
+            await pong
+            stats["ping_s"].append(time.perf_counter() - t1)
+        if requests:
+            from auto_dataset_client_mimic import build_request, get_test_dataset
+            dataset = get_test_dataset()
+            for i in range(requests):
+                t1 = time.perf_counter()
+                await websocket.send(build_request(dataset[i % len(dataset)]))
+                await websocket.recv()
+                stats["request_s"].append(time.perf_counter() - t1)
+    except Exception as e:
+        stats["session_errors"].append(type(e).__name__)
+    finally:
+        await websocket.close()
+
+
+async def load_test(uri: str, connections: int, pings: int, requests: int, connect_rate: float) -> Dict[str, Any]:
+    stats: Dict[str, Any] = {"connect_s": [], "ping_s": [], "request_s": [], "connect_errors": [], "session_errors": []}
+    start_barrier = asyncio.Event()
+    tasks = []
+    t0 = time.perf_counter()
+    for _ in range(connections):
+        tasks.append(asyncio.create_task(run_connection(uri, pings, requests, start_barrier, stats)))
+        if connect_rate > 0:
+            await asyncio.sleep(1 / connect_rate)
+    while len(stats["connect_s"]) + len(stats["connect_errors"]) < connections:
+        await asyncio.sleep(0.01)
+    connect_wall = time.perf_counter() - t0
+
+    t1 = time.perf_counter()
+    start_barrier.set()
+    await asyncio.gather(*tasks)
+    session_wall = time.perf_counter() - t1
+
+    return {
+        "connections": connections,
+        "connected": len(stats["connect_s"]),
+        "connect_errors": len(stats["connect_errors"]),
+        "session_errors": len(stats["session_errors"]),
+        "connect_wall_s": connect_wall,
+        "connects_per_s": len(stats["connect_s"]) / connect_wall if connect_wall > 0 else 0.0,
+        "connect_latency_s": percentiles(stats["connect_s"]),
+        "ping_latency_s": percentiles(stats["ping_s"]),
+        "pings_per_s": len(stats["ping_s"]) / session_wall if session_wall > 0 else 0.0,
+        "request_latency_s": percentiles(stats["request_s"]),
+        "requests_per_s": len(stats["request_s"]) / session_wall if stats["request_s"] else 0.0,
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="WebSocket gateway connection-capacity test")
+    parser.add_argument("--uri", default="ws://localhost:8765")
+    parser.add_argument("--connections", type=int, nargs="+", default=[100, 500, 1000])
+    parser.add_argument("--pings", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=0, help="ASR tasks per connection (needs worker + corpus)")
+    parser.add_argument("--connect-rate", type=float, default=0, help="new connections per second, 0 = all at once")
+    parser.add_argument("--label", default="", help="free-form tag, e.g. the gateway process count")
+    return parser.parse_args(argv)
+
+
+async def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    for connections in args.connections:
+        result = await load_test(args.uri, connections, args.pings, args.requests, args.connect_rate)
+        print(json.dumps({"label": args.label, **result}), flush=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from log import get_logger
+
+"""
+Bounded store for frontend_api batch-test jobs.
+
+Results are appended to one JSONL file per job as each request completes, only the byte offset
+of every line stays in memory, so a job costs the same in the API process for 10 or 1,000 samples.
+Jobs expire JOB_TTL seconds after they finish, and at most JOB_MAX_JOBS are kept (oldest first out,
+a running job that gets evicted is cancelled).
+"""
+
+JOB_RESULT_DIR = os.environ.get("ASR_JOB_RESULT_DIR", "batch_results")
+JOB_TTL = float(os.environ.get("ASR_JOB_TTL", 3600))
+JOB_MAX_JOBS = int(os.environ.get("ASR_JOB_MAX_JOBS", 20))
+logger = get_logger()
+
+
+class BatchJob:
+    def __init__(self, task_id: str, total: int, result_path: str):
+        self.task_id = task_id
+        self.total = total
+        self.result_path = result_path
+        self.status = "running"
+        self.error: Optional[str] = None
+        self.completed = 0
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.__offsets: List[int] = []
+        self.__writer = open(result_path, "a+", encoding="utf-8")
+
+    def append_result(self, result: Dict[str, Any]):
+        self.__writer.seek(0, os.SEEK_END)
+        self.__offsets.append(self.__writer.tell())
+        self.__writer.write(json.dumps(result, ensure_ascii=False) + "\n")
+        self.__writer.flush()
+        self.completed += 1
+
+    def results(self, offset: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        if offset >= len(self.__offsets) or limit <= 0:
+            return []
+        self.__writer.seek(self.__offsets[offset])
+        return [json.loads(self.__writer.readline()) for _ in range(min(limit, len(self.__offsets) - offset))]
+
+    def finish(self, status: str, error: Optional[str] = None):
+        if self.status != "running":
+            return
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+
+    def close(self):
+        self.__writer.close()
+        try:
+            os.remove(self.result_path)
+        except FileNotFoundError:
+            pass
+
+    def summary(self) -> Dict[str, Any]:
+        summary = {
+            "task_id": self.task_id,
+            "status": self.status,
+            "completed": self.completed,
+            "total": self.total,
+            "progress": int(100 * self.completed / self.total) if self.total else 100,
+        }
+        if self.error is not None:
+            summary["error"] = self.error
+        return summary
+
+
+class BatchJobStore:
+    def __init__(self, result_dir: str = JOB_RESULT_DIR, max_jobs: int = JOB_MAX_JOBS, ttl: float = JOB_TTL):
+        self.result_dir = result_dir
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self.__jobs: "OrderedDict[str, BatchJob]" = OrderedDict()
+        os.makedirs(result_dir, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self.__jobs)
+
+    def create(self, total: int) -> BatchJob:
+        self.evict()
+        while len(self.__jobs) >= self.max_jobs:
+            self.remove(next(iter(self.__jobs)))
+        task_id = str(uuid.uuid4())
+        job = BatchJob(task_id, total, os.path.join(self.result_dir, f"{task_id}.jsonl"))
+        self.__jobs[task_id] = job
+        return job
+
+    def get(self, task_id: str) -> Optional[BatchJob]:
+        self.evict()
+        return self.__jobs.get(task_id)
+
+    def cancel(self, task_id: str) -> Optional[BatchJob]:
+        job = self.__jobs.get(task_id)
+        if job is None:
+            return None
+        if job.task is not None and not job.task.done():
+            job.task.cancel()
+        job.finish("cancelled")
+        return job
+
+    def remove(self, task_id: str):
+        job = self.__jobs.pop(task_id, None)
+        if job is None:
+            return
+        if job.task is not None and not job.task.done():
+            job.task.cancel()
+        job.close()
+        logger.info(f"Batch job {task_id} evicted")
+
+    def evict(self):
+        now = time.time()
+        expired = [task_id for task_id, job in self.__jobs.items()
+                   if job.finished_at is not None and now - job.finished_at > self.ttl]
+        for task_id in expired:
+            self.remove(task_id)
@@ -1,14 +1,97 @@
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
+import threading
+import time
 
-os.makedirs("log", exist_ok=True)
-logger = logging.getLogger(__name__)
-logging.basicConfig(
-    filename="log/app_test_take_off.log",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
+"""
+Non-blocking logging: callers only enqueue records, a QueueListener thread does the disk / console I/O.
+
+environment:
+    ASR_LOG_LEVEL          DEBUG / INFO / WARNING ... (default INFO)
+    ASR_LOG_FILE           log file path (default log/app_test_take_off.log)
+    ASR_LOG_CONSOLE        1 to echo records on stderr, 0 to keep them in the file only (default 1)
+    ASR_LOG_QUEUE_SIZE     max pending records, newer records are dropped when full (default 10000)
+    ASR_LOG_HOT_INTERVAL   seconds between two records from the same hot-path call site (default 1.0)
+"""
+
+LOG_LEVEL = os.environ.get("ASR_LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.environ.get("ASR_LOG_FILE", "log/app_test_take_off.log")
+LOG_CONSOLE = os.environ.get("ASR_LOG_CONSOLE", "1").lower() not in ("0", "false", "no")
+LOG_QUEUE_SIZE = int(os.environ.get("ASR_LOG_QUEUE_SIZE", 10000))
+LOG_HOT_INTERVAL = float(os.environ.get("ASR_LOG_HOT_INTERVAL", 1.0))
+
+
+class DropWhenFullQueueHandler(logging.handlers.QueueHandler):
+    """Never block the caller: when the writer falls behind, count and drop the record"""
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """Pass at most one record per `interval` seconds for each call site (file, line).
+    The next record that passes carries how many were suppressed in between."""
+    def __init__(self, interval: float):
+        super().__init__()
+        self.interval = interval
+        self.__last_emit = dict()
+        self.__suppressed = dict()
+        self.__lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.__lock:
+            if now - self.__last_emit.get(key, float("-inf")) < self.interval:
+                self.__suppressed[key] = self.__suppressed.get(key, 0) + 1
+                return False
+            self.__last_emit[key] = now
+            suppressed = self.__suppressed.pop(key, 0)
+        if suppressed:
+            record.msg = f"{record.msg} (+{suppressed} suppressed)"
+        return True
+
+
+log_dir = os.path.dirname(LOG_FILE)
+if log_dir:
+    os.makedirs(log_dir, exist_ok=True)
+
+formatter = logging.Formatter(
+    fmt="%(asctime)s - %(levelname)s - %(message)s",
     datefmt="%Y-%m-%d %H:%M:%S"
 )
+output_handlers = [logging.FileHandler(LOG_FILE)]
+if LOG_CONSOLE:
+    output_handlers.append(logging.StreamHandler())
+for handler in output_handlers:
+    handler.setFormatter(formatter)
+
+log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+queue_handler = DropWhenFullQueueHandler(log_queue)
+listener = logging.handlers.QueueListener(log_queue, *output_handlers, respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)
+
+root_logger = logging.getLogger()
+root_logger.setLevel(LOG_LEVEL)
+root_logger.addHandler(queue_handler)
+
+logger = logging.getLogger(__name__)
+hot_logger = logging.getLogger(f"{__name__}.hot")
+hot_logger.addFilter(RateLimitFilter(LOG_HOT_INTERVAL))
 
 def get_logger():
-    return logger
\ No newline at end of file
+    return logger
+
+def get_hot_logger():
+    """Logger for per-request / per-chunk messages, rate limited per call site"""
+    return hot_logger
@@ -0,0 +1,125 @@
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+from log import get_logger
+
+"""
+Prometheus metrics shared by the gateway (ASR_websockets.py) and the worker (ASR_server.py).
+Each process exposes its own /metrics endpoint, labelled by `component`.
+Request-level timings are also logged as one JSON line keyed by correlation_id,
+so a slow request can be followed across the broker hop.
+"""
+
+GATEWAY_METRICS_PORT = int(os.environ.get("ASR_GATEWAY_METRICS_PORT", 9101))
+WORKER_METRICS_PORT = int(os.environ.get("ASR_WORKER_METRICS_PORT", 9102))
+# multi-process gateway: process i listens on GATEWAY_METRICS_PORT_BASE + i, clear of the single-process ports
+GATEWAY_METRICS_PORT_BASE = int(os.environ.get("ASR_GATEWAY_METRICS_PORT_BASE", 9110))
+PUBLISH_TS_HEADER = "publish_ts"
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+logger = get_logger()
+
+STAGE_SECONDS = Histogram(
+    "asr_stage_seconds", "Duration of a single pipeline stage",
+    ["component", "stage"], buckets=LATENCY_BUCKETS,
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "asr_queue_wait_seconds", "Time between gateway publish and worker pick-up",
+    buckets=LATENCY_BUCKETS,
+)
+BATCH_SIZE = Histogram(
+    "asr_batch_size", "Number of clips per model call",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+IN_FLIGHT = Gauge(
+    "asr_in_flight_requests", "Requests accepted but not yet answered", ["component"],
+)
+PENDING_FUTURES = Gauge(
+    "asr_gateway_pending_futures", "Size of the correlation_id -> future map in the gateway",
+)
+CACHE_HITS = Counter("asr_cache_hits_total", "Cache hits", ["cache"])
+CACHE_MISSES = Counter("asr_cache_misses_total", "Cache misses", ["cache"])
+REQUESTS = Counter("asr_requests_total", "Finished requests", ["component", "status"])
+RSS_BYTES = Gauge("asr_process_rss_bytes", "Resident set size of this process")
+ALLOCATED_BLOCKS = Gauge("asr_python_allocated_blocks", "sys.getallocatedblocks() of this process")
+ARENA_BYTES = Gauge("asr_arena_bytes", "Bytes held by the worker's reusable buffers")
+ARENA_ALLOCATIONS = Gauge("asr_arena_allocations", "Buffers the arena had to allocate since start")
+ARENA_HITS = Gauge("asr_arena_hits", "Buffer requests served from the arena since start")
+PACK_FALLBACK_CLIPS = Counter(
+    "asr_pack_fallback_clips_total", "Packed clips re-transcribed alone because the timestamp split failed", ["reason"],
+)
+CASCADE_CLIPS = Gauge("asr_cascade_clips", "Clips answered by the fast model or escalated, since start", ["outcome"])
+CASCADE_ESCALATION_RATE = Gauge("asr_cascade_escalation_rate", "Share of clips re-run on the accurate model")
+
+
+def rss_bytes() -> int:
+    # Linux: second field of statm is resident pages
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def register_memory_gauges(arena=None):
+    """Sampled on scrape only, nothing runs on the request path"""
+    RSS_BYTES.set_function(rss_bytes)
+    ALLOCATED_BLOCKS.set_function(sys.getallocatedblocks)
+    if arena is not None:
+        ARENA_BYTES.set_function(arena.nbytes)
+        ARENA_ALLOCATIONS.set_function(lambda: arena.allocations)
+        ARENA_HITS.set_function(lambda: arena.hits)
+
+
+def register_cascade_gauges(cascade):
+    CASCADE_CLIPS.labels("accepted").set_function(lambda: cascade.accepted)
+    CASCADE_CLIPS.labels("escalated").set_function(lambda: cascade.escalated)
+    CASCADE_ESCALATION_RATE.set_function(cascade.escalation_rate)
+
+
+def start_metrics_server(port: int):
+    start_http_server(port)
+    logger.info(f"Prometheus metrics on :{port}/metrics")
+
+
+@contextmanager
+def stage_timer(component: str, stage: str, timings: Optional[Dict[str, float]] = None):
+    """Observe the wrapped block into asr_stage_seconds, and into `timings` if given"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(component, stage).observe(elapsed)
+        if timings is not None:
+            timings[stage] = elapsed
+
+
+def observe_timings(component: str, timings: Dict[str, float]):
+    for stage, elapsed in timings.items():
+        STAGE_SECONDS.labels(component, stage).observe(elapsed)
+
+
+def observe_queue_wait(headers: Optional[Dict], timings: Optional[Dict[str, float]] = None) -> Optional[float]:
+    """Queue wait from the publish timestamp the gateway put in the AMQP headers"""
+    if not headers or PUBLISH_TS_HEADER not in headers:
+        return None
+    wait = max(0.0, time.time() - float(headers[PUBLISH_TS_HEADER]))
+    QUEUE_WAIT_SECONDS.observe(wait)
+    if timings is not None:
+        timings["queue_wait"] = wait
+    return wait
+
+
+def log_request_timings(component: str, correlation_id: str, timings: Dict[str, float]):
+    logger.info("timings " + json.dumps({
+        "component": component,
+        "correlation_id": correlation_id,
+        **{stage: round(elapsed, 6) for stage, elapsed in timings.items()},
+    }))
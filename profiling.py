@@ -0,0 +1,167 @@
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+import torch
+from torch.profiler import ProfilerActivity, profile, record_function
+
+from log import get_logger
+
+"""
+On-demand profiling of the inference path in ASRServer.
+
+Nothing is installed until `arm()` is called (control message {"action": "profile"} or a task
+with "profile": true), so the default path only pays for one integer check per task.
+torch mode writes <tag>.trace.json (chrome://tracing / Perfetto) and <tag>.ops.txt with
+op-level summaries split into encoder / decoder; cprofile mode writes <tag>.pstats and <tag>.txt.
+"""
+
+PROFILE_DIR = os.environ.get("ASR_PROFILE_DIR", "profile")
+# upper bound for one arm() call, every profiled call writes its own trace files and disables packing
+PROFILE_MAX_COUNT = int(os.environ.get("ASR_PROFILE_MAX_COUNT", 100))
+PROFILE_MODES = ("torch", "cprofile")
+STAGES = ("encoder", "decoder")
+logger = get_logger()
+
+
+class StageRanges:
+    """Temporary forward hooks that wrap the encoder / decoder forward in record_function ranges"""
+    def __init__(self, model: torch.nn.Module):
+        self.model = model
+        self.handles = []
+
+    def __enter__(self):
+        base = getattr(self.model, "model", self.model)
+        for stage in STAGES:
+            module = getattr(base, stage, None)
+            if module is None:
+                continue
+            ranges: List[Any] = []
+
+            def pre_hook(mod, args, stage=stage, ranges=ranges):
+                ranges.append(record_function(stage).__enter__())
+
+            def post_hook(mod, args, output, ranges=ranges):
+                if ranges:
+                    ranges.pop().__exit__(None, None, None)
+
+            self.handles.append(module.register_forward_pre_hook(pre_hook))
+            self.handles.append(module.register_forward_hook(post_hook))
+        return self
+
+    def __exit__(self, *exc):
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
+
+
+class InferenceProfiler:
+    def __init__(self, output_dir: str = PROFILE_DIR):
+        self.output_dir = output_dir
+        self.remaining = 0
+        self.mode = "torch"
+        self.__lock = threading.Lock()
+
+    def arm(self, count: int = 1, mode: str = "torch") -> Dict[str, Any]:
+        """Profile the next `count` calls, clamped to PROFILE_MAX_COUNT.
+        Raises ValueError for an unknown mode or a count that is not a number."""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode}, expected one of {PROFILE_MODES}")
+        try:
+            count = int(count)
+        except (TypeError, ValueError, OverflowError):
+            # control messages come from any websocket client, a bad count must not kill the worker
+            raise ValueError(f"Invalid profile count {count!r}") from None
+        if count > PROFILE_MAX_COUNT:
+            logger.warning(f"Profile count {count} clamped to ASR_PROFILE_MAX_COUNT={PROFILE_MAX_COUNT}")
+        with self.__lock:
+            self.remaining = min(max(0, count), PROFILE_MAX_COUNT)
+            self.mode = mode
+        logger.info(f"Profiler armed for {self.remaining} call(s), mode={mode}, output={self.output_dir}")
+        return {"status": "armed", "count": self.remaining, "mode": mode, "output_dir": self.output_dir}
+
+    def run(self, model: Union[torch.nn.Module, Sequence[torch.nn.Module]], fn: Callable, *args,
+            tag: str = "", **kwargs) -> Any:
+        """Call fn under the profiler and consume one armed slot.
+        model: the model(s) fn runs, their encoder / decoder forwards are recorded as stage ranges"""
+        with self.__lock:
+            self.remaining -= 1
+            mode = self.mode
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}_{tag or 'task'}")
+        if mode == "cprofile":
+            return self.__run_cprofile(base, fn, *args, **kwargs)
+        return self.__run_torch(base, model, fn, *args, **kwargs)
+
+    def __run_cprofile(self, base: str, fn: Callable, *args, **kwargs) -> Any:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+            profiler.dump_stats(f"{base}.pstats")
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(40)
+            with open(f"{base}.txt", "w") as f:
+                f.write(text.getvalue())
+            logger.info(f"cProfile written to {base}.pstats")
+
+    def __run_torch(self, base: str, model: Union[torch.nn.Module, Sequence[torch.nn.Module]],
+                    fn: Callable, *args, **kwargs) -> Any:
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        models = [model] if isinstance(model, torch.nn.Module) else list(model)
+        with profile(activities=activities, record_shapes=True) as prof:
+            with ExitStack() as stack:
+                for each in models:
+                    stack.enter_context(StageRanges(each))
+                result = fn(*args, **kwargs)
+        prof.export_chrome_trace(f"{base}.trace.json")
+        with open(f"{base}.ops.txt", "w") as f:
+            f.write(stage_op_summary(prof.events()))
+            f.write("\n== all ops ==\n")
+            f.write(prof.key_averages().table(sort_by="self_cpu_time_total", row_limit=30))
+        logger.info(f"torch profile written to {base}.trace.json")
+        return result
+
+
+def stage_of(event: Any) -> Optional[str]:
+    parent = event.cpu_parent
+    while parent is not None:
+        if parent.name in STAGES:
+            return parent.name
+        parent = parent.cpu_parent
+    return None
+
+
+def stage_op_summary(events: Any, row_limit: int = 20) -> str:
+    """Self CPU time per op, grouped by the encoder / decoder range it ran under"""
+    totals: Dict[str, Dict[str, List[float]]] = {stage: defaultdict(lambda: [0.0, 0]) for stage in STAGES}
+    for event in events:
+        if event.name in STAGES:
+            continue
+        stage = stage_of(event)
+        if stage is None:
+            continue
+        total = totals[stage][event.name]
+        total[0] += event.self_cpu_time_total
+        total[1] += 1
+
+    lines = []
+    for stage in STAGES:
+        ops = sorted(totals[stage].items(), key=lambda item: item[1][0], reverse=True)
+        stage_us = sum(us for us, _ in totals[stage].values())
+        lines.append(f"== {stage}: {stage_us / 1000:.2f} ms self CPU ==")
+        lines.append(f"{'op':<48}{'self_cpu_ms':>14}{'calls':>10}")
+        for name, (us, calls) in ops[:row_limit]:
+            lines.append(f"{name[:47]:<48}{us / 1000:>14.3f}{calls:>10}")
+        lines.append("")
+    return "\n".join(lines)
@@ -0,0 +1,65 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from log import get_logger
+
+"""
+Per-session decoding context for real-time streams, keyed by "session_id" in the task JSON.
+
+state of a session:
+    language  Whisper language code, detected on the first chunk and then locked
+    prompt    tail of the transcript so far, fed to the decoder as prompt for the next chunk
+Sessions idle for more than SESSION_IDLE_S are evicted, and at most SESSION_MAX are kept (LRU).
+"""
+
+SESSION_MAX = int(os.environ.get("ASR_SESSION_MAX", 1000))
+SESSION_IDLE_S = float(os.environ.get("ASR_SESSION_IDLE_S", 300))
+SESSION_PROMPT_CHARS = int(os.environ.get("ASR_SESSION_PROMPT_CHARS", 200))
+logger = get_logger()
+
+
+class SessionCache:
+    def __init__(self, max_sessions: int = SESSION_MAX, idle_seconds: float = SESSION_IDLE_S,
+                 prompt_chars: int = SESSION_PROMPT_CHARS):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.prompt_chars = prompt_chars
+        self.__sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.__sessions)
+
+    def get(self, session_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """State dict of the session (created on first use), None when the task has no session"""
+        if not session_id:
+            return None
+        now = time.monotonic()
+        self.evict(now)
+        state = self.__sessions.pop(session_id, None)
+        if state is None:
+            state = {"language": None, "prompt": None}
+            while len(self.__sessions) >= self.max_sessions:
+                self.__sessions.popitem(last=False)
+        state["last_seen"] = now
+        self.__sessions[session_id] = state
+        return state
+
+    def append_text(self, state: Dict[str, Any], text: str):
+        """Keep only the tail of the transcript, cut at a word boundary"""
+        text = " ".join(part for part in (state.get("prompt"), text.strip()) if part)
+        if len(text) > self.prompt_chars:
+            text = text[-self.prompt_chars:]
+            text = text.split(" ", 1)[-1] if " " in text else text
+        state["prompt"] = text or None
+
+    def evict(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        # OrderedDict is in last_seen order, stop at the first session still active
+        while self.__sessions:
+            session_id, state = next(iter(self.__sessions.items()))
+            if now - state["last_seen"] <= self.idle_seconds:
+                break
+            self.__sessions.popitem(last=False)
+            logger.info(f"Session {session_id} evicted after {self.idle_seconds:.0f}s idle")
@@ -0,0 +1,60 @@
+from typing import Dict, Tuple
+
+import numpy as np
+import torch
+
+"""
+Reusable buffers for the inference hot path.
+
+The worker handles one request at a time, so a single buffer per size class is enough:
+a buffer handed out by the arena is only valid until the next call that asks for the same
+size class (or the same feature shape). Callers that keep data longer must copy it.
+
+Audio buffers are only used for packed windows (ASR_PACK=1). A single clip is handed to the
+feature extractor as decoded, so on the default path only the feature tensor is reused; the
+extractor's own intermediate arrays are still allocated per request.
+"""
+
+MIN_SIZE_CLASS = 1 << 14
+
+
+def size_class(n: int) -> int:
+    """Round up to the next power of two, at least MIN_SIZE_CLASS"""
+    return max(MIN_SIZE_CLASS, 1 << max(0, n - 1).bit_length())
+
+
+class TensorArena:
+    def __init__(self, device: torch.device):
+        self.device = device
+        self.__audio: Dict[int, np.ndarray] = {}
+        self.__features: Dict[Tuple[Tuple[int, ...], torch.dtype], torch.Tensor] = {}
+        # hits / allocations since start, steady state means allocations stops growing
+        self.hits = 0
+        self.allocations = 0
+
+    def audio(self, n: int) -> np.ndarray:
+        """float32 buffer of length n from its size class, contents undefined"""
+        bucket = size_class(n)
+        buffer = self.__audio.get(bucket)
+        if buffer is None:
+            buffer = self.__audio[bucket] = np.empty(bucket, dtype=np.float32)
+            self.allocations += 1
+        else:
+            self.hits += 1
+        return buffer[:n]
+
+    def features(self, source: np.ndarray, dtype: torch.dtype) -> torch.Tensor:
+        """Copy log-mel features into the persistent model-input tensor of that shape/dtype"""
+        key = (tuple(source.shape), dtype)
+        tensor = self.__features.get(key)
+        if tensor is None:
+            tensor = self.__features[key] = torch.empty(source.shape, dtype=dtype, device=self.device)
+            self.allocations += 1
+        else:
+            self.hits += 1
+        tensor.copy_(torch.from_numpy(source), non_blocking=True)
+        return tensor
+
+    def nbytes(self) -> int:
+        return (sum(buffer.nbytes for buffer in self.__audio.values())
+                + sum(t.numel() * t.element_size() for t in self.__features.values()))
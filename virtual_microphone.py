@@ -0,0 +1,154 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import websockets
+
+from client_real_mimic_api import CHUNK_SIZE, RATE, speech_loop
+from corpus_pack import CorpusPack, read_wav
+from log import get_logger
+
+"""
+File-backed virtual microphone, for soak-testing real-time traffic on headless boxes.
+
+VirtualMicrophone replays WAV files or corpus-pack clips at real-time pace and plugs into the
+same chunk / VAD / send loop as client_real_mimic_api.py. Like a sound card buffer, a speaker
+that fell behind (waiting for a reply) gets the chunks it missed immediately, so the measured
+lag includes server time.
+
+run 200 simulated speakers for 2 minutes against the gateway:
+    python virtual_microphone.py --speakers 200 --corpus corpus/librispeech_dummy --duration 120 --jitter-ms 20
+    python virtual_microphone.py --speakers 10 --wav a.wav b.wav
+"""
+
+logger = get_logger()
+
+
+class VirtualMicrophone:
+    def __init__(self, pcm: np.ndarray, loop_audio: bool = True, jitter_s: float = 0.0,
+                 rng: Optional[random.Random] = None, start_offset: int = 0):
+        """pcm: 16kHz int16 mono, may be shared by many microphones (read only);
+        jitter_s: max random delay added to each chunk delivery; start_offset: first sample to play"""
+        self.pcm = pcm
+        self.loop_audio = loop_audio
+        self.jitter_s = jitter_s
+        self.rng = rng or random.Random()
+        self.position = start_offset - start_offset % CHUNK_SIZE
+        self.started_at: Optional[float] = None
+        # wall-clock time the last delivered sample was "spoken"
+        self.last_chunk_due: Optional[float] = None
+
+    @staticmethod
+    def to_pcm(sources: List[np.ndarray]) -> np.ndarray:
+        """Concatenate float32 clips in [-1.0, 1.0] with 1s of silence between them, as int16"""
+        gap = np.zeros(RATE, dtype=np.float32)
+        audio = np.concatenate([piece for source in sources for piece in (source, gap)])
+        return (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+
+    async def read(self) -> Optional[bytes]:
+        """Next CHUNK_SIZE frames as int16 bytes, not before they would have been spoken"""
+        if self.started_at is None:
+            self.started_at = time.time() - self.position / RATE
+        if self.position + CHUNK_SIZE > len(self.pcm):
+            if not self.loop_audio:
+                return None
+            # keep one continuous schedule across loops, so a speaker that fell behind still catches up
+            self.started_at += self.position / RATE
+            self.position = 0
+        due = self.started_at + (self.position + CHUNK_SIZE) / RATE
+        delay = due - time.time() + (self.rng.uniform(0, self.jitter_s) if self.jitter_s else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        chunk = self.pcm[self.position:self.position + CHUNK_SIZE]
+        self.position += CHUNK_SIZE
+        self.last_chunk_due = due
+        return chunk.tobytes()
+
+
+async def run_speaker(index: int, uri: str, mic: VirtualMicrophone, duration: float, start_delay: float) -> Dict[str, Any]:
+    await asyncio.sleep(start_delay)
+    lags: List[float] = []
+    errors = 0
+
+    def on_result(result, info):
+        # lag: from the moment the last sent sample was spoken to the transcript arriving
+        lags.append(info["received_at"] - mic.last_chunk_due)
+
+    try:
+        async with websockets.connect(uri, max_size=10 * 1024 * 1024) as websocket:
+            await speech_loop(websocket, mic.read, str(uuid.uuid4()), on_result, max_session_s=duration)
+    except Exception as e:
+        errors += 1
+        logger.error(f"speaker {index} failed: {e}")
+
+    summary: Dict[str, Any] = {"speaker": index, "replies": len(lags), "errors": errors}
+    if lags:
+        p50, p95 = np.percentile(lags, [50, 95])
+        summary.update({"lag_p50_s": float(p50), "lag_p95_s": float(p95), "lag_max_s": float(max(lags))})
+    return summary
+
+
+def load_sources(args: argparse.Namespace) -> List[np.ndarray]:
+    if args.corpus:
+        pack = CorpusPack(args.corpus)
+        return [pack.audio(i) for i in range(len(pack)) if pack.manifest[i]["sample_rate"] == RATE]
+    sources = []
+    for path in args.wav:
+        audio, sample_rate = read_wav(path)
+        if sample_rate != RATE:
+            raise ValueError(f"{path}: expected {RATE} Hz, got {sample_rate} Hz")
+        sources.append(audio)
+    return sources
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Simulate real-time speakers from audio files")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--wav", nargs="+", help="16kHz 16-bit PCM wav files")
+    source.add_argument("--corpus", help="corpus pack directory (see corpus_pack.py)")
+    parser.add_argument("--uri", default="ws://localhost:8765")
+    parser.add_argument("--speakers", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds per speaker session")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="max random delay per chunk")
+    parser.add_argument("--ramp-s", type=float, default=5.0, help="spread speaker start times over this many seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+async def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    sources = load_sources(args)
+    if not sources:
+        raise ValueError("No 16kHz audio found in the given sources")
+    rng = random.Random(args.seed)
+    # one PCM buffer shared by all speakers, memory does not grow with --speakers
+    pcm = VirtualMicrophone.to_pcm(sources)
+
+    speakers = []
+    for index in range(args.speakers):
+        # every speaker starts at a different point, so they are not in lockstep
+        mic = VirtualMicrophone(pcm, jitter_s=args.jitter_ms / 1000, rng=random.Random(rng.random()),
+                                start_offset=rng.randrange(max(1, len(pcm) - CHUNK_SIZE)))
+        start_delay = rng.uniform(0, args.ramp_s) if args.ramp_s > 0 else 0.0
+        speakers.append(run_speaker(index, args.uri, mic, args.duration, start_delay))
+    summaries = await asyncio.gather(*speakers)
+
+    for summary in summaries:
+        print(json.dumps(summary))
+    lags = [s["lag_p50_s"] for s in summaries if "lag_p50_s" in s]
+    print(json.dumps({
+        "speakers": args.speakers,
+        "replies": sum(s["replies"] for s in summaries),
+        "errors": sum(s["errors"] for s in summaries),
+        "median_of_speaker_p50_lag_s": float(np.median(lags)) if lags else None,
+        "worst_speaker_p95_lag_s": max((s["lag_p95_s"] for s in summaries if "lag_p95_s" in s), default=None),
+    }))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())